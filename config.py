@@ -12,10 +12,100 @@ TEACHER_CODE = "0306"
 
 # Настройки базы данных
 DATABASE_URL = "sqlite:///bot_database.db"
+DB_POOL_SIZE = 4            # Количество постоянных соединений с SQLite
+DB_BUSY_TIMEOUT = 5000      # Ожидание блокировки файла БД (мс)
+DB_COMMIT_INTERVAL = 0.003  # Окно накопления записей для группового коммита (сек)
+DB_WRITE_BATCH = 500        # Максимум записей в одной транзакции
+USER_CACHE_SIZE = 10000     # Пользователей в кэше ролей
+USER_CACHE_TTL = 300        # Время жизни записи кэша пользователей (сек)
+DB_SLOW_QUERY_MS = 100      # Запросы дольше этого пишутся в лог с параметрами и планом
+DB_CHECK_QUERY_PLANS = False  # Проверять планы горячих запросов (тесты): полный просмотр — ошибка
+
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = "polling"
+
+# Настройки webhook (для BOT_MODE = "webhook")
+WEBHOOK_URL = ""            # Публичный адрес, например https://bot.example.com (пусто — не вызывать setWebhook)
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = ""         # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = "127.0.0.1"
+WEBAPP_PORT = 8080
+
+# Метрики в формате Prometheus (только локально; 0 — не запускать сервер)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Сторож цикла событий: период замера задержки и порог блокировки (сек)
+LOOP_LAG_INTERVAL = 0.1
+LOOP_LAG_THRESHOLD = 0.1    # Дольше — стек цикла снимается и пишется в лог, отчёт по /lag
+
+# Профилирование по командам /profile и /memprofile (только преподаватель)
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+PROFILE_INTERVAL = 0.005        # Период выборки стеков профиля CPU (сек)
+PROFILE_TRACEMALLOC_FRAMES = 5   # Глубина стека, которую запоминает tracemalloc (больше — дольше снимок)
+
+# Лимиты исходящих сообщений (Telegram: ~30 сообщений/с всего, ~1/с в чат, ~20/мин в группу)
+SEND_GLOBAL_RATE = 30
+SEND_CHAT_RATE = 1
+SEND_CHAT_BURST = 3
+SEND_GROUP_CHAT_RATE = 20 / 60
+SEND_MAX_RETRIES = 5
+SEND_CONCURRENCY = 10       # Одновременных запросов к Bot API из очереди
+
+# Рассылка объявлений о новых заданиях: одновременных отправок
+BROADCAST_CONCURRENCY = 50
+
+# Напоминания
+LESSON_REMINDER_MINUTES = 30    # За сколько минут напоминать о занятии
+HOMEWORK_REMINDER_TIME = "18:00"  # Во сколько накануне срока напоминать о задании
+REMINDER_GRACE = 600            # Пропущенные (бот был выключен) не дольше стольких секунд ещё отправляются
+
+# Кэш недельного расписания учеников
+WEEK_CACHE_SIZE = 5000
+WEEK_CACHE_TTL = 3600
+
+# Кэш экранов «Расписание» и «Домашние задания»
+SCREEN_CACHE_SIZE = 10000
+SCREEN_CACHE_TTL = 600
+
+# Хранилище файлов сданных работ
+UPLOAD_DIR = "uploads"
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024   # Bot API отдаёт ботам файлы не больше 20 МБ
+STUDENT_QUOTA = 200 * 1024 * 1024    # Суммарный объём работ одного ученика
+UPLOAD_CHUNK_SIZE = 64 * 1024
+BLOB_CACHE_SIZE = 500 * 1024 * 1024  # Кэш файлов, скачанных по file_id для выгрузки и превью
+EXPORT_PART_SIZE = 49 * 1024 * 1024  # Часть архива работ: Bot API принимает документы до 50 МБ
+
+# Превью фотографий работ (нужен Pillow)
+PREVIEW_WORKERS = 2          # Процессов для обработки изображений
+PREVIEW_SIZE = 1280          # Большая сторона превью (px)
+PREVIEW_QUALITY = 80         # Качество JPEG превью и обзорных листов
+PREVIEW_SHEET_COLUMNS = 3    # Обзорный лист: колонок
+PREVIEW_SHEET_ROWS = 3       # Обзорный лист: строк
+PREVIEW_SHEET_CELL = 400     # Размер ячейки обзорного листа (px)
+
+# Подбор свободного времени при пересечении занятий
+WORKDAY_START = "08:00"
+WORKDAY_END = "21:00"
+SLOT_STEP_MINUTES = 15
+
+# Хранилище состояний FSM (диалогов) в SQLite
+FSM_STATE_TTL = 7 * 24 * 3600   # Незавершённый диалог забывается через неделю (сек)
+FSM_FLUSH_INTERVAL = 1.0        # Период пакетной записи изменений на диск (сек)
+FSM_CACHE_SIZE = 5000           # Максимум состояний в памяти
+
+# Количество элементов на странице списков (задания, группы)
+PAGE_SIZE = 5
 
 # Настройки логирования
 LOG_LEVEL = "INFO" 
 LOG_FILE = "bot.log"
+LOG_MAX_BYTES = 10 * 1024 * 1024   # Размер файла лога, после которого он сжимается и начинается новый
+LOG_BACKUP_COUNT = 30              # Сколько сжатых частей лога хранить
+LOG_JSON = False                   # Писать в файл JSON-строки с update_id и user_id
+# Доля записываемых сообщений ниже WARNING для шумных логгеров
+LOG_SAMPLING = {"aiogram.event": 0.1}
 
 # Часовой пояс
 TIMEZONE = "Europe/Moscow"
\ No newline at end of file
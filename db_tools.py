@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Служебные команды обслуживания базы данных
+
+Запуск:
+    python3 db_tools.py check-counts            # проверить счётчики участников групп
+    python3 db_tools.py check-counts --repair   # проверить и исправить
+    python3 db_tools.py gc-uploads              # удалить файлы, не относящиеся ни к одной работе
+    python3 db_tools.py check-plans             # проверить, что горячие запросы используют индексы
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+
+from database import Database
+from utils.helpers import format_file_size
+from utils.storage import BlobStorage
+from utils.previews import PreviewService
+from utils.querystats import QueryPlanError
+
+
+async def check_counts(db, repair):
+    """Проверка (и исправление) денормализованных счётчиков участников"""
+    if repair:
+        mismatches = await db.repair_member_counts()
+    else:
+        mismatches = await db.check_member_counts()
+
+    if not mismatches:
+        print("✅ Счётчики участников групп согласованы")
+        return 0
+
+    for item in mismatches:
+        print(f"Группа {item['group_id']}: сохранено {item['stored']}, фактически {item['actual']}")
+    if repair:
+        print(f"🔧 Исправлено групп: {len(mismatches)}")
+        return 0
+    print("Запустите с --repair для исправления")
+    return 1
+
+
+async def gc_uploads(db):
+    """Удаление брошенных скачиваний и превью файлов, на которые больше не ссылаются работы"""
+    storage = BlobStorage(db)
+    referenced = await db.get_referenced_file_hashes()
+    removed, freed = await asyncio.to_thread(storage.remove_stale_parts)
+    # Превью удалённых файлов и старые обзорные листы (листы строятся заново по запросу)
+    previews_removed, previews_freed = await asyncio.to_thread(PreviewService(db, storage).remove_stale, referenced)
+    removed += previews_removed
+    freed += previews_freed
+    print(f"🧹 Удалено файлов: {removed}, освобождено {format_file_size(freed)}")
+
+    # Колонка file_path из базовой схемы удаляется, только когда ни одна работа
+    # не хранит файл лишь на диске; такие файлы в uploads/ не трогаются
+    disk_only = await db.count_disk_only_submissions()
+    if disk_only:
+        print(f"⚠️ Работ с файлом только на диске (file_path без file_id): {disk_only}; "
+              "колонка file_path и их файлы сохранены")
+    elif disk_only == 0:
+        await db.drop_submission_file_path()
+        print("🗑 Колонка submissions.file_path больше не используется и удалена")
+    return 0
+
+
+def copy_without_stats(source, target):
+    """Копия базы без статистики планировщика (sqlite_stat*)
+
+    PRAGMA optimize при закрытии бота собирает статистику, и на небольшой
+    базе планировщик честно предпочитает просмотр таблицы индексу. Проверка
+    планов спрашивает другое — есть ли у запроса путь по индексу, — поэтому
+    она идёт на копии, где планировщик ориентируется только на схему.
+    """
+    with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(target)) as dst:
+        src.backup(dst)
+        tables = [row[0] for row in dst.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'sqlite_stat%'"
+        )]
+        for table in tables:
+            dst.execute(f"DELETE FROM {table}")
+        dst.commit()
+
+
+async def check_plans(db_path):
+    """Проверка планов горячих запросов: ни один не должен просматривать таблицу целиком"""
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_path = os.path.join(tmp, "plans.db")
+        await asyncio.to_thread(copy_without_stats, db_path, copy_path)
+        db = Database(copy_path, check_plans=True)
+        await db.init()
+        try:
+            return await _check_plans(db)
+        finally:
+            await db.close()
+
+
+async def _check_plans(db):
+    # Реальные id, чтобы запросы ученика строились с его группами
+    groups = await db.get_all_groups()
+    members = await db.get_group_members(groups[0]['id']) if groups else []
+    user_id = members[0]['user_id'] if members else 0
+    homework = await db.get_all_homework()
+    homework_id = homework[0]['id'] if homework else 0
+    group_id = groups[0]['id'] if groups else 0
+
+    calls = [
+        ("get_user", (user_id,)),
+        ("get_user_groups", (user_id,)),
+        ("get_user_homework", (user_id,)),
+        ("get_user_homework_page", (user_id,)),
+        ("get_homework_details", (homework_id, user_id)),
+        ("get_user_schedule", (user_id,)),
+        ("get_group_members", (group_id,)),
+        ("get_homework_submissions", (homework_id,)),
+        ("get_submission", (0,)),
+        ("get_fsm_record", ("",)),
+    ]
+    failed = 0
+    for name, call_args in calls:
+        # Кэш пользователей не должен скрыть запрос
+        db.user_cache.clear()
+        try:
+            await getattr(db, name)(*call_args)
+        except QueryPlanError as e:
+            failed += 1
+            print(f"❌ {e}\n")
+        else:
+            print(f"✅ {name}")
+    return 1 if failed else 0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных бота")
+    parser.add_argument("--db", default="bot_database.db", help="Путь к файлу базы данных")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    counts = subparsers.add_parser("check-counts", help="Проверить счётчики участников групп")
+    counts.add_argument("--repair", action="store_true", help="Исправить расхождения")
+    subparsers.add_parser("gc-uploads", help="Удалить неиспользуемые файлы работ")
+    subparsers.add_parser("check-plans", help="Проверить планы горячих запросов")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "check-plans":
+        return await check_plans(args.db)
+
+    db = Database(args.db)
+    await db.init()
+    try:
+        if args.command == "check-counts":
+            return await check_counts(db, args.repair)
+        if args.command == "gc-uploads":
+            return await gc_uploads(db)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Версионированные миграции схемы базы данных
+
+Каждая миграция выполняется в отдельной транзакции на синхронном
+соединении sqlite3 (в потоке писателя Database) и записывается
+в таблицу schema_migrations. Новые миграции добавляются в конец MIGRATIONS.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _0001_base_schema(conn):
+    """Базовые таблицы"""
+    # Таблица пользователей
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER UNIQUE NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            role TEXT DEFAULT 'student',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица групп
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица участников групп
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS group_members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER,
+            user_id INTEGER,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES groups (id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+    # Таблица домашних заданий
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS homework (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            group_id INTEGER,
+            user_id INTEGER,
+            due_date TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES groups (id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+    # Таблица сданных работ
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            homework_id INTEGER,
+            user_id INTEGER,
+            file_path TEXT,
+            text_content TEXT,
+            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            grade INTEGER,
+            feedback TEXT,
+            FOREIGN KEY (homework_id) REFERENCES homework (id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+    # Таблица расписания
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schedule (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            group_id INTEGER,
+            day_of_week INTEGER,
+            time TEXT,
+            duration INTEGER DEFAULT 60,
+            subject TEXT DEFAULT 'Английский язык',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (group_id) REFERENCES groups (id)
+        )
+    """)
+
+
+def _0002_dedupe_and_unique(conn):
+    """Удалить дубликаты и добавить ограничения уникальности"""
+    # Участник группы: оставляем самую раннюю запись о вступлении
+    removed = conn.execute("""
+        DELETE FROM group_members WHERE id NOT IN (
+            SELECT MIN(id) FROM group_members GROUP BY group_id, user_id
+        )
+    """).rowcount
+    if removed:
+        logger.info(f"Удалено дубликатов участников групп: {removed}")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_group_members_group_user
+        ON group_members (group_id, user_id)
+    """)
+
+    # Сданная работа: оставляем последнюю отправку, как делал бы INSERT OR REPLACE
+    removed = conn.execute("""
+        DELETE FROM submissions WHERE id NOT IN (
+            SELECT MAX(id) FROM submissions GROUP BY homework_id, user_id
+        )
+    """).rowcount
+    if removed:
+        logger.info(f"Удалено дубликатов сданных работ: {removed}")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_homework_user
+        ON submissions (homework_id, user_id)
+    """)
+
+
+def _0003_lookup_indexes(conn):
+    """Индексы для горячих запросов"""
+    # Подзапрос "SELECT group_id FROM group_members WHERE user_id = ?" читает только индекс
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_group_members_user_group
+        ON group_members (user_id, group_id)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_homework_group
+        ON homework (group_id, due_date)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_homework_user
+        ON homework (user_id, due_date)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_schedule_user
+        ON schedule (user_id, day_of_week, time)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_schedule_group
+        ON schedule (group_id, day_of_week, time)
+    """)
+
+
+def _0004_group_member_count(conn):
+    """Денормализованный счётчик участников группы, поддерживаемый триггерами"""
+    conn.execute("""
+        ALTER TABLE groups ADD COLUMN member_count INTEGER NOT NULL DEFAULT 0
+    """)
+    conn.execute("""
+        UPDATE groups SET member_count = (
+            SELECT COUNT(*) FROM group_members gm WHERE gm.group_id = groups.id
+        )
+    """)
+    # INSERT OR IGNORE для существующей пары не вставляет строку и триггер не срабатывает
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_group_members_insert
+        AFTER INSERT ON group_members
+        BEGIN
+            UPDATE groups SET member_count = member_count + 1 WHERE id = NEW.group_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_group_members_delete
+        AFTER DELETE ON group_members
+        BEGIN
+            UPDATE groups SET member_count = member_count - 1 WHERE id = OLD.group_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_group_members_move
+        AFTER UPDATE OF group_id ON group_members
+        WHEN OLD.group_id IS NOT NEW.group_id
+        BEGIN
+            UPDATE groups SET member_count = member_count - 1 WHERE id = OLD.group_id;
+            UPDATE groups SET member_count = member_count + 1 WHERE id = NEW.group_id;
+        END
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_groups_created
+        ON groups (created_at)
+    """)
+
+
+def _0005_pagination_indexes(conn):
+    """Индекс для постраничного вывода заданий"""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_homework_created
+        ON homework (created_at)
+    """)
+
+
+def _0006_fsm_states(conn):
+    """Хранилище состояний FSM"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fsm_states_updated
+        ON fsm_states (updated_at)
+    """)
+
+
+def _0007_homework_deliveries(conn):
+    """Статусы доставки объявлений о новых заданиях"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS homework_deliveries (
+            homework_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (homework_id, user_id),
+            FOREIGN KEY (homework_id) REFERENCES homework (id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_homework_deliveries_pending
+        ON homework_deliveries (status, homework_id)
+    """)
+
+
+def _0008_sent_reminders(conn):
+    """Журнал отправленных напоминаний (защита от повторной отправки)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sent_reminders (
+            kind TEXT NOT NULL,
+            ref_id INTEGER NOT NULL,
+            occurrence TEXT NOT NULL,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, ref_id, occurrence)
+        ) WITHOUT ROWID
+    """)
+
+
+
+def _0009_submission_files(conn):
+    """Файлы работ хранятся в Telegram: file_id, имя, размер и SHA-256 скачанной копии
+
+    Колонка file_path из базовой схемы не трогается: работы, файлы которых
+    лежат только на диске, остаются с путём, пока `db_tools.py gc-uploads`
+    не убедится, что таких нет.
+    """
+    conn.execute("ALTER TABLE submissions ADD COLUMN file_name TEXT")
+    conn.execute("ALTER TABLE submissions ADD COLUMN file_hash TEXT")
+    conn.execute("ALTER TABLE submissions ADD COLUMN file_size INTEGER")
+    conn.execute("ALTER TABLE submissions ADD COLUMN file_id TEXT")
+    conn.execute("ALTER TABLE submissions ADD COLUMN file_unique_id TEXT")
+    conn.execute("ALTER TABLE submissions ADD COLUMN file_type TEXT")
+    # Подсчёт занятого учеником объёма (одинаковые файлы — по file_unique_id)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submissions_user
+        ON submissions (user_id, file_unique_id)
+    """)
+    # Хэш скачанного файла проставляется всем работам с тем же file_unique_id
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submissions_file_unique_id
+        ON submissions (file_unique_id)
+    """)
+    # Хэши файлов, на которые ссылаются работы, для сборки мусора превью
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submissions_file_hash
+        ON submissions (file_hash)
+    """)
+
+
+# Упорядоченный список миграций: (версия, описание, функция)
+MIGRATIONS = [
+    (1, "Базовая схема", _0001_base_schema),
+    (2, "Дедупликация и уникальные ограничения", _0002_dedupe_and_unique),
+    (3, "Индексы для горячих запросов", _0003_lookup_indexes),
+    (4, "Счётчик участников групп", _0004_group_member_count),
+    (5, "Индексы для пагинации", _0005_pagination_indexes),
+    (6, "Состояния FSM", _0006_fsm_states),
+    (7, "Доставка объявлений о заданиях", _0007_homework_deliveries),
+    (8, "Отправленные напоминания", _0008_sent_reminders),
+    (9, "Файлы сданных работ", _0009_submission_files),
+]
+
+
+def get_schema_version(conn):
+    """Текущая версия схемы (0 для пустой базы)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """Применить все непримененные миграции по порядку
+
+    Ожидает соединение в режиме autocommit (isolation_level=None).
+    Возвращает итоговую версию схемы.
+    """
+    current = get_schema_version(conn)
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Применяется миграция {version}: {name}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                (version, name)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            logger.exception(f"Миграция {version} не применена")
+            raise
+        current = version
+    return current
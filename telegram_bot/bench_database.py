@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк методов Database: соединение на каждый вызов vs пул соединений
+и писатель с групповым коммитом
+
+Запуск: python3 bench_database.py [количество_итераций]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+from database import Database
+from records import User, Group, Homework, ScheduleEntry
+from utils.membership import MembershipIndex
+
+
+class ConnectPerCallDatabase(Database):
+    """Старое поведение: новое соединение на каждый запрос
+
+    Без кэша пользователей и индекса участников групп: роль и группы
+    ученика каждый раз читаются из SQLite, как до их появления.
+    """
+
+    @asynccontextmanager
+    async def _connection(self):
+        async with aiosqlite.connect(self.db_path) as db:
+            yield db
+
+    async def _write_many(self, statements):
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("PRAGMA busy_timeout = 30000")
+            lastrowid = None
+            for sql, params in statements:
+                cursor = await db.execute(sql, params)
+                if lastrowid is None:
+                    lastrowid = cursor.lastrowid
+            await db.commit()
+            return lastrowid
+
+    async def get_user(self, user_id):
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT * FROM users WHERE user_id = ?
+            """, (user_id,))
+            cursor.row_factory = User.row_factory
+            return await cursor.fetchone()
+
+    async def get_user_groups(self, user_id):
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT id, name, description, created_at, member_count
+                FROM groups
+                WHERE id IN (SELECT group_id FROM group_members WHERE user_id = ?)
+            """, (user_id,))
+            cursor.row_factory = Group.row_factory
+            return await cursor.fetchall()
+
+    async def get_user_homework(self, user_id):
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT h.*, s.grade, s.submitted_at,
+                       CASE WHEN s.id IS NOT NULL THEN 'submitted' ELSE 'pending' END as status
+                FROM homework h
+                LEFT JOIN submissions s ON h.id = s.homework_id AND s.user_id = ?
+                WHERE h.user_id = ? OR h.group_id IN (
+                    SELECT group_id FROM group_members WHERE user_id = ?
+                )
+                ORDER BY h.due_date ASC
+            """, (user_id, user_id, user_id))
+            cursor.row_factory = Homework.row_factory
+            return await cursor.fetchall()
+
+    async def get_user_schedule(self, user_id):
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT s.*, g.name as group_name
+                FROM schedule s
+                LEFT JOIN groups g ON s.group_id = g.id
+                WHERE s.user_id = ? OR s.group_id IN (
+                    SELECT group_id FROM group_members WHERE user_id = ?
+                )
+                ORDER BY s.day_of_week, s.time
+            """, (user_id, user_id))
+            cursor.row_factory = ScheduleEntry.row_factory
+            return await cursor.fetchall()
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def seed(db, users=200, groups=10, homework=300):
+    """Заполнить базу тестовыми данными"""
+    await db.init()
+    for user_id in range(1, users + 1):
+        await db.add_user(user_id, f"user{user_id}", "Имя", "Фамилия")
+    for g in range(groups):
+        group_id = await db.create_group(f"Группа {g}")
+        for user_id in range(g + 1, users + 1, groups):
+            await db.add_user_to_group(group_id, user_id)
+        await db.create_schedule_entry(None, group_id, g % 7 + 1, f"{8 + g:02d}:00")
+    for h in range(homework):
+        await db.create_homework(f"Задание {h}", "", group_id=h % groups + 1, due_date="2025-12-01")
+
+
+async def measure(db, iterations):
+    """Замерить задержку каждого метода, мс"""
+    calls = {
+        "get_user": lambda i: db.get_user(i % 200 + 1),
+        "get_user_groups": lambda i: db.get_user_groups(i % 200 + 1),
+        "get_user_homework": lambda i: db.get_user_homework(i % 200 + 1),
+        "get_user_schedule": lambda i: db.get_user_schedule(i % 200 + 1),
+        "get_group_members": lambda i: db.get_group_members(i % 10 + 1),
+        "get_all_groups": lambda i: db.get_all_groups(),
+    }
+    results = {}
+    for name, call in calls.items():
+        samples = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            await call(i)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = (percentile(samples, 50), percentile(samples, 99))
+    return results
+
+
+async def measure_start_storm(db, registrations, first_user_id):
+    """Шторм /start: конкурентные add_user, регистраций в секунду"""
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        db.add_user(first_user_id + i, f"storm{i}", "Имя", "Фамилия")
+        for i in range(registrations)
+    ))
+    return registrations / (time.perf_counter() - start)
+
+
+def measure_membership_memory(count):
+    """Объём индекса участников для count пар (ученик, группа)"""
+    index = MembershipIndex()
+    # Каждый ученик состоит в двух группах по 20 человек
+    students = count // 2
+    index.load(
+        (group_id, user_id)
+        for user_id in range(1_000_000, 1_000_000 + students)
+        for group_id in (user_id % (students // 10) + 1, user_id % (students // 10) + students // 10 + 1)
+    )
+    return len(index), index.memory_usage()
+
+
+async def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        seeded = Database(db_path)
+        await seed(seeded)
+        await seeded.close()
+
+        before = ConnectPerCallDatabase(db_path)
+        after = Database(db_path)
+        # init загружает индекс участников групп для варианта «после»
+        await before.init()
+        await after.init()
+        before_results = await measure(before, iterations)
+        after_results = await measure(after, iterations)
+        before_storm = await measure_start_storm(before, 1000, 100_000)
+        after_storm = await measure_start_storm(after, 1000, 200_000)
+        await before.close()
+        await after.close()
+
+    print(f"{'метод':<20} {'до p50':>9} {'до p99':>9} {'после p50':>10} {'после p99':>10}  (мс)")
+    for name, (b50, b99) in before_results.items():
+        a50, a99 = after_results[name]
+        print(f"{name:<20} {b50:>9.3f} {b99:>9.3f} {a50:>10.3f} {a99:>10.3f}")
+
+    print(f"\n/start шторм (1000 конкурентных add_user): "
+          f"до {before_storm:.0f}/с, после {after_storm:.0f}/с")
+
+    memberships, size = measure_membership_memory(100_000)
+    print(f"\nИндекс участников групп: {memberships} записей, "
+          f"{size / 1024 / 1024:.1f} МБ ({size / memberships:.0f} байт на запись)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -9,55 +9,54 @@
 import asyncio
 import logging
 import sys
-import os
-from datetime import datetime, timedelta
-from pathlib import Path
 
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, CallbackQuery, Document, PhotoSize
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.types import Message, CallbackQuery, FSInputFile, InputMediaPhoto
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 
 # Импорты модулей проекта
 try:
-    from config import BOT_TOKEN, TEACHER_CODE
-    from database import Database
+    from config import BOT_TOKEN, TEACHER_CODE, BOT_MODE
+    from utils.fsm_storage import SQLiteStorage
+    from utils.webhook import run_webhook
+    from utils.logs import setup_logging, LogContextMiddleware
+    from utils.metrics import Metrics, setup_metrics, start_metrics_server
+    from utils.watchdog import LoopWatchdog
+    from utils.profiling import Profiler, parse_seconds
+    from utils.sender import OutboundSender, SenderRequestMiddleware
+    from utils.broadcast import Broadcaster
+    from utils.reminders import ReminderScheduler
+    from utils.schedule import WeekScheduleCache
+    from utils.screens import ScreenCache
+    from utils.storage import BlobStorage, QuotaExceeded
+    from utils.export import SubmissionExporter
+    from utils.previews import PreviewService, PreviewError, is_photo
     from utils.keyboards import (
         get_main_menu, get_teacher_menu, get_student_menu,
         get_groups_keyboard, get_homework_keyboard, get_schedule_keyboard,
-        get_back_keyboard, get_grade_keyboard, get_days_keyboard
+        get_back_keyboard, get_grade_keyboard, get_submissions_keyboard,
+        get_contact_sheet_keyboard, get_photo_preview_keyboard
     )
     from utils.helpers import (
-        is_teacher, format_homework_list, format_schedule,
-        validate_time_format, is_valid_file_type, format_file_size
+        db, is_teacher, format_homework_list,
+        is_valid_file_type, format_file_size,
+        parse_page_callback
     )
 except ImportError as e:
     print(f"Ошибка импорта модулей: {e}")
     print("Убедитесь, что все файлы проекта находятся в одной директории")
     sys.exit(1)
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Инициализация
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+# Обработчики регистрируются при импорте; бот, диспетчер и сервисы создаёт main():
+# процессы пула превью импортируют этот модуль заново и не должны их повторять
 router = Router()
-dp.include_router(router)
 
 # Состояния FSM
 class TeacherStates(StatesGroup):
@@ -75,13 +74,6 @@ class StudentStates(StatesGroup):
     submitting_homework = State()
     messaging_classmate = State()
 
-# Инициализация базы данных
-db = Database()
-
-# Создание директории для файлов
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
     """Обработчик команды /start"""
@@ -231,4 +223,488 @@ async def show_group_details(callback: CallbackQuery):
     
     keyboard = get_groups_keyboard([group_info], show_members=True)
     await callback.message.edit_text(text, reply_markup=keyboard)
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+@router.callback_query(F.data == "my_homework")
+@router.callback_query(F.data.startswith("hw_page_"))
+async def show_my_homework(callback: CallbackQuery, state: FSMContext, screens: ScreenCache):
+    """Показать домашние задания ученика (постранично)"""
+    # Возврат к списку отменяет начатую сдачу работы; без неё хранилище не трогаем
+    if await state.get_state() is not None:
+        await state.clear()
+    after_id, before_id = None, None
+    if callback.data != "my_homework":
+        after_id, before_id = parse_page_callback(callback.data)
+    
+    text, keyboard = await screens.homework(callback.from_user.id, after_id=after_id, before_id=before_id)
+    
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data == "my_schedule")
+async def show_my_schedule(callback: CallbackQuery, screens: ScreenCache):
+    """Показать расписание ученика"""
+    text, keyboard = await screens.schedule(callback.from_user.id)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data.in_({"schedule_week", "schedule_next_week"}))
+async def show_week_schedule(callback: CallbackQuery, week_schedule: WeekScheduleCache):
+    """Показать расписание на эту или следующую неделю"""
+    weeks_ahead = 1 if callback.data == "schedule_next_week" else 0
+    _, text = await week_schedule.get_week(callback.from_user.id, weeks_ahead)
+    
+    try:
+        await callback.message.edit_text(text, reply_markup=get_schedule_keyboard())
+    except TelegramBadRequest:
+        # Повторное нажатие на ту же неделю: сообщение не изменилось
+        pass
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("homework_"))
+async def show_homework_details(callback: CallbackQuery, state: FSMContext):
+    """Показать задание ученику"""
+    homework_id = int(callback.data.split("_")[1])
+    user_id = callback.from_user.id
+    homework = await db.get_homework_details(homework_id, user_id)
+    
+    if homework is None or not (
+        homework['user_id'] == user_id
+        or (homework['group_id'] is not None and db.members.is_member(homework['group_id'], user_id))
+    ):
+        await callback.answer("❌ Задание не найдено", show_alert=True)
+        return
+    
+    text = f"📝 <b>{homework['title']}</b>\n\n"
+    if homework['description']:
+        text += f"{homework['description']}\n\n"
+    text += f"📅 Срок: {homework['due_date'] or 'Не указан'}\n"
+    if homework['grade']:
+        text += f"⭐ Оценка: {homework['grade']}/5\n"
+    elif homework['status'] == 'submitted':
+        text += "⏳ Работа сдана, ожидает проверки\n"
+    
+    await state.update_data(homework_id=homework_id)
+    await callback.message.edit_text(text, reply_markup=get_homework_keyboard([], detailed=True))
+    await callback.answer()
+
+@router.callback_query(F.data == "submit_homework")
+async def start_submission(callback: CallbackQuery, state: FSMContext, blob_storage: BlobStorage):
+    """Начать сдачу работы по выбранному заданию"""
+    data = await state.get_data()
+    if 'homework_id' not in data:
+        await callback.answer("Сначала выберите задание", show_alert=True)
+        return
+    
+    await state.set_state(StudentStates.submitting_homework)
+    await callback.message.edit_text(
+        "📎 <b>Сдача работы</b>\n\n"
+        "Отправьте файл (pdf, doc, docx, txt, jpg, png, zip), фото или текст ответа.\n"
+        f"Максимальный размер файла — {format_file_size(blob_storage.max_size)}.",
+        reply_markup=get_back_keyboard("my_homework")
+    )
+    await callback.answer()
+
+@router.message(StudentStates.submitting_homework)
+async def receive_submission(message: Message, state: FSMContext, blob_storage: BlobStorage):
+    """Принять работу: файл, фото или текст"""
+    data = await state.get_data()
+    homework_id = data['homework_id']
+    user_id = message.from_user.id
+    
+    if message.document:
+        file = message.document
+        file_type = "document"
+        file_name = file.file_name or "file"
+        if not is_valid_file_type(file_name):
+            await message.answer("❌ Недопустимый тип файла. Разрешены: pdf, doc, docx, txt, jpg, jpeg, png, zip")
+            return
+    elif message.photo:
+        # Самый крупный из вариантов фото
+        file = message.photo[-1]
+        file_type = "photo"
+        file_name = f"photo_{file.file_unique_id}.jpg"
+    elif message.text:
+        await db.submit_homework(homework_id, user_id, text_content=message.text)
+        file = None
+    else:
+        await message.answer("❌ Отправьте файл, фото или текст ответа")
+        return
+    
+    if file is not None:
+        # Файл остаётся в Telegram: сохраняем только file_id, скачивание — по требованию
+        try:
+            await blob_storage.check_quota(user_id, homework_id, file.file_size)
+        except QuotaExceeded:
+            available = min(blob_storage.max_size, await blob_storage.available(user_id, homework_id))
+            await message.answer(
+                "❌ <b>Файл слишком большой</b>\n\n"
+                f"Сейчас можно загрузить не больше {format_file_size(available)}."
+            )
+            return
+        await db.submit_homework(
+            homework_id, user_id, text_content=message.caption, file_name=file_name,
+            file_size=file.file_size, file_id=file.file_id, file_unique_id=file.file_unique_id,
+            file_type=file_type
+        )
+    
+    await state.clear()
+    await message.answer(
+        "✅ <b>Работа сдана!</b>\n\nОльга Александровна проверит её и поставит оценку.",
+        reply_markup=get_student_menu()
+    )
+
+# Обработчики для преподавателя
+@router.callback_query(F.data == "manage_homework")
+@router.callback_query(F.data.startswith("hw_tpage_"))
+async def manage_homework(callback: CallbackQuery):
+    """Управление домашними заданиями (постранично)"""
+    if not await is_teacher(callback.from_user.id):
+        await callback.answer("⛔ Доступно только преподавателю", show_alert=True)
+        return
+    
+    after_id, before_id = None, None
+    if callback.data != "manage_homework":
+        after_id, before_id = parse_page_callback(callback.data)
+    
+    page = await db.get_all_homework_page(after_id=after_id, before_id=before_id)
+    text = format_homework_list(page['items'], is_teacher=True)
+    keyboard = get_homework_keyboard(
+        page['items'], is_teacher=True, prev_id=page['prev_id'], next_id=page['next_id']
+    )
+    
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("hw_manage_"))
+async def show_homework_submissions(callback: CallbackQuery, previews: PreviewService):
+    """Работы учеников по заданию"""
+    if not await is_teacher(callback.from_user.id):
+        await callback.answer("⛔ Доступно только преподавателю", show_alert=True)
+        return
+    
+    homework_id = int(callback.data.split("_")[2])
+    homework = await db.get_homework_details(homework_id)
+    if homework is None:
+        await callback.answer("❌ Задание не найдено", show_alert=True)
+        return
+    submissions = await db.get_homework_submissions(homework_id)
+    
+    text = f"📝 <b>{homework['title']}</b>\n"
+    text += f"📅 Срок: {homework['due_date'] or 'Не указан'}\n\n"
+    if submissions:
+        graded = sum(1 for submission in submissions if submission['grade'])
+        text += f"📎 Сдано работ: <b>{len(submissions)}</b>, проверено: {graded}\n\n"
+        text += "Выберите работу для проверки:"
+    else:
+        text += "📭 Работ пока нет"
+    
+    photos = previews.available and any(is_photo(submission) for submission in submissions)
+    keyboard = get_submissions_keyboard(homework_id, submissions, photos=photos)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("hw_export_"))
+async def export_homework_submissions(callback: CallbackQuery, exporter: SubmissionExporter):
+    """Отправить преподавателю архив со всеми работами по заданию"""
+    if not await is_teacher(callback.from_user.id):
+        await callback.answer("⛔ Доступно только преподавателю", show_alert=True)
+        return
+    
+    homework_id = int(callback.data.split("_")[2])
+    if await db.get_homework_details(homework_id) is None:
+        await callback.answer("❌ Задание не найдено", show_alert=True)
+        return
+    
+    # Архив собирается в фоне: файлы скачиваются и упаковываются по одному
+    exporter.start(homework_id, callback.message.chat.id)
+    await callback.answer("📦 Готовлю архив, он придёт отдельными сообщениями", show_alert=True)
+
+async def show_preview_image(callback: CallbackQuery, previews: PreviewService, path, caption, keyboard):
+    """Показать картинку превью: заменить в том же сообщении или отправить новое"""
+    # Картинка, уже загруженная в Telegram, отправляется по file_id
+    photo = previews.file_id(path) or FSInputFile(path)
+    if callback.message.photo:
+        result = await callback.message.edit_media(
+            InputMediaPhoto(media=photo, caption=caption), reply_markup=keyboard
+        )
+    else:
+        result = await callback.message.answer_photo(photo, caption=caption, reply_markup=keyboard)
+    previews.remember_file_id(path, result)
+
+@router.callback_query(F.data.startswith("sheet_"))
+async def show_contact_sheet(callback: CallbackQuery, previews: PreviewService):
+    """Обзорный лист фото работ по заданию"""
+    if not await is_teacher(callback.from_user.id):
+        await callback.answer("⛔ Доступно только преподавателю", show_alert=True)
+        return
+    
+    _, homework_id, page = callback.data.split("_")
+    homework_id, page = int(homework_id), int(page)
+    await callback.answer()
+    try:
+        sheet = await previews.contact_sheet(callback.bot, homework_id, page)
+    except (PreviewError, TelegramBadRequest) as e:
+        await callback.message.answer(f"❌ Не удалось показать фото: {e}")
+        return
+    if sheet is None:
+        await callback.message.answer("📭 Фото-работ по этому заданию нет")
+        return
+    # Пока преподаватель смотрит лист, остальные превью готовятся в фоне
+    previews.warm_up(callback.bot, homework_id)
+    
+    homework = await db.get_homework_details(homework_id)
+    caption = f"🖼 <b>{homework['title']}</b>\n"
+    caption += f"Фото {sheet['start'] + 1}–{sheet['start'] + len(sheet['items'])} из {sheet['count']}\n"
+    caption += "Нажмите номер, чтобы открыть работу"
+    keyboard = get_contact_sheet_keyboard(
+        homework_id, sheet['start'], len(sheet['items']), sheet['page'], sheet['pages'], previews.columns
+    )
+    await show_preview_image(callback, previews, sheet['path'], caption, keyboard)
+
+@router.callback_query(F.data.startswith("photo_"))
+async def show_photo_preview(callback: CallbackQuery, previews: PreviewService):
+    """Превью одной фото-работы с листанием"""
+    if not await is_teacher(callback.from_user.id):
+        await callback.answer("⛔ Доступно только преподавателю", show_alert=True)
+        return
+    
+    _, homework_id, index = callback.data.split("_")
+    homework_id, index = int(homework_id), int(index)
+    photos = await previews.photo_submissions(homework_id)
+    if not photos:
+        await callback.answer("📭 Фото-работ по этому заданию нет", show_alert=True)
+        return
+    index = min(index, len(photos) - 1)
+    submission = photos[index]
+    await callback.answer()
+    try:
+        path = await previews.preview(callback.bot, submission)
+    except (PreviewError, TelegramBadRequest) as e:
+        await callback.message.answer(f"❌ Не удалось показать фото: {e}")
+        return
+    
+    name = " ".join(filter(None, [submission['first_name'], submission['last_name']]))
+    caption = f"🖼 {index + 1} из {len(photos)}\n👤 {name or submission['user_id']}\n"
+    caption += f"📅 Сдано: {submission['submitted_at'][:16]}"
+    if submission['grade']:
+        caption += f"\n⭐ Оценка: {submission['grade']}/5"
+    keyboard = get_photo_preview_keyboard(
+        homework_id, index, len(photos), submission['id'], index // previews.sheet_size
+    )
+    await show_preview_image(callback, previews, path, caption, keyboard)
+
+@router.callback_query(F.data == "previews_close")
+async def close_previews(callback: CallbackQuery):
+    """Закрыть просмотр фото"""
+    await callback.message.delete()
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("sub_"))
+async def show_submission(callback: CallbackQuery):
+    """Отправить преподавателю работу ученика"""
+    if not await is_teacher(callback.from_user.id):
+        await callback.answer("⛔ Доступно только преподавателю", show_alert=True)
+        return
+    
+    submission = await db.get_submission(int(callback.data.split("_")[1]))
+    if submission is None:
+        await callback.answer("❌ Работа не найдена", show_alert=True)
+        return
+    
+    name = " ".join(filter(None, [submission['first_name'], submission['last_name']]))
+    caption = f"📝 <b>{submission['homework_title']}</b>\n"
+    caption += f"👤 {name or submission['user_id']}\n"
+    caption += f"📅 Сдано: {submission['submitted_at'][:16]}\n"
+    if submission['grade']:
+        caption += f"⭐ Оценка: {submission['grade']}/5\n"
+    if submission['text_content']:
+        caption += f"\n{submission['text_content']}"
+    keyboard = get_grade_keyboard(submission['homework_id'], submission['user_id'])
+    
+    # Файл пересылается по file_id и не скачивается на наш сервер
+    if submission['file_type'] == "photo":
+        await callback.message.answer_photo(submission['file_id'], caption=caption[:1024], reply_markup=keyboard)
+    elif submission['file_id']:
+        await callback.message.answer_document(submission['file_id'], caption=caption[:1024], reply_markup=keyboard)
+    else:
+        await callback.message.answer(caption, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("grade_"))
+async def set_submission_grade(callback: CallbackQuery, sender: OutboundSender):
+    """Выставить оценку за работу"""
+    if not await is_teacher(callback.from_user.id):
+        await callback.answer("⛔ Доступно только преподавателю", show_alert=True)
+        return
+    
+    _, homework_id, user_id, grade = callback.data.split("_")
+    homework_id, user_id, grade = int(homework_id), int(user_id), int(grade)
+    await db.set_grade(homework_id, user_id, grade)
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.answer(f"⭐ Оценка {grade}/5 выставлена")
+    
+    homework = await db.get_homework_details(homework_id)
+    try:
+        await sender.send_message(
+            user_id, f"⭐ <b>Работа проверена!</b>\n\n📝 {homework['title']}\nОценка: <b>{grade}/5</b>"
+        )
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
+        logger.warning(f"Не удалось уведомить ученика {user_id} об оценке: {e}")
+
+@router.callback_query(F.data == "manage_groups")
+@router.callback_query(F.data.startswith("groups_page_"))
+async def manage_groups(callback: CallbackQuery):
+    """Управление группами (постранично)"""
+    if not await is_teacher(callback.from_user.id):
+        await callback.answer("⛔ Доступно только преподавателю", show_alert=True)
+        return
+    
+    after_id, before_id = None, None
+    if callback.data != "manage_groups":
+        after_id, before_id = parse_page_callback(callback.data)
+    
+    page = await db.get_all_groups_page(after_id=after_id, before_id=before_id)
+    if page['items']:
+        text = "👥 <b>Управление группами</b>\n\nВыберите группу или создайте новую:"
+    else:
+        text = "👥 <b>Групп пока нет</b>\n\nСоздайте первую группу:"
+    keyboard = get_groups_keyboard(
+        page['items'], is_teacher=True, prev_id=page['prev_id'], next_id=page['next_id']
+    )
+    
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+@router.message(Command("lag"))
+async def show_loop_lag(message: Message, watchdog: LoopWatchdog):
+    """Задержка цикла событий и главные источники блокировок"""
+    if not await is_teacher(message.from_user.id):
+        await message.answer("⛔ Доступно только преподавателю")
+        return
+    
+    await message.answer(watchdog.report())
+
+@router.message(Command("profile", "memprofile"))
+async def start_profile(message: Message, command: CommandObject, profiler: Profiler):
+    """Профиль CPU (/profile N) или снимки памяти (/memprofile N) за N секунд"""
+    if not await is_teacher(message.from_user.id):
+        await message.answer("⛔ Доступно только преподавателю")
+        return
+    
+    seconds = parse_seconds(command.args)
+    if seconds is None:
+        await message.answer(f"❌ Укажите длительность в секундах, например: /{command.command} 30")
+        return
+    
+    # Профиль снимается в фоне, отчёт придёт документом
+    if command.command == "profile":
+        started = profiler.start_cpu(message.chat.id, seconds)
+        text = f"🔥 Снимаю профиль CPU: {seconds} с, отчёт придёт документом"
+    else:
+        started = profiler.start_memory(message.chat.id, seconds)
+        text = (
+            f"🧠 Снимаю снимки памяти с интервалом {seconds} с, отчёт придёт документом\n\n"
+            "⚠️ В начале и в конце замера бот может на несколько секунд перестать отвечать"
+        )
+    if not started:
+        await message.answer("⏳ Такой профиль уже снимается, дождитесь отчёта")
+        return
+    await message.answer(text)
+
+def create_dispatcher(bot):
+    """Диспетчер со всеми сервисами бота
+
+    Сервисы хранятся в данных диспетчера: aiogram передаёт обработчику те,
+    что названы в его параметрах (screens, previews, sender, ...).
+    """
+    dp = Dispatcher(storage=SQLiteStorage(db))
+    # update_id и user_id обновления в записях лога
+    dp.update.outer_middleware(LogContextMiddleware())
+    dp.include_router(router)
+    # Очередь исходящих сообщений для рассылок
+    sender = OutboundSender(bot)
+    # Прямые ответы обработчиков тоже расходуют общий лимит очереди
+    bot.session.middleware(SenderRequestMiddleware(sender))
+    # Время обработки обновлений, методов базы и запросов к Bot API (/metrics)
+    metrics = Metrics()
+    setup_metrics(metrics, dp, bot, db)
+    metrics.gauge(
+        "bot_sender_queue_depth", "Сообщения в очереди исходящих по приоритетам",
+        lambda: {(("lane", lane),): sender.stats()[f"{lane}_depth"] for lane in ("interactive", "bulk")}
+    )
+    metrics.gauge(
+        "bot_sql_seconds", "Суммарное время SQL-запросов по методам Database",
+        lambda: {(("method", method),): round(total, 6) for method, (_, total) in db.query_stats.by_method().items()}
+    )
+    # Объявления о новых заданиях рассылаются всем ученикам группы
+    broadcaster = Broadcaster(db, sender)
+    db.subscribe("homework_created", broadcaster.on_homework_created)
+    # Напоминания о занятиях и сроках сдачи
+    reminders = ReminderScheduler(db, sender)
+    db.subscribe("schedule_created", reminders.on_schedule_created)
+    db.subscribe("homework_created", reminders.on_homework_created)
+    # Расписание на неделю вычисляется один раз на пользователя и неделю
+    week_schedule = WeekScheduleCache(db)
+    db.subscribe("schedule_created", week_schedule.on_schedule_created)
+    db.subscribe("group_member_added", week_schedule.on_group_member_added)
+    # Готовые экраны расписания и заданий ученика, сбрасываются при изменениях
+    screens = ScreenCache(db)
+    db.subscribe("group_member_added", screens.on_group_member_added)
+    db.subscribe("schedule_created", screens.on_schedule_created)
+    db.subscribe("homework_created", screens.on_homework_created)
+    db.subscribe("submission_changed", screens.on_submission_changed)
+    # Квоты и локальный кэш файлов сданных работ (создаёт директорию uploads/)
+    blob_storage = BlobStorage(db)
+    dp.workflow_data.update(
+        sender=sender,
+        metrics=metrics,
+        broadcaster=broadcaster,
+        reminders=reminders,
+        week_schedule=week_schedule,
+        screens=screens,
+        blob_storage=blob_storage,
+        # Выгрузка всех работ по заданию архивом (в фоне, частями до лимита Bot API)
+        exporter=SubmissionExporter(db, blob_storage, sender),
+        # Превью и обзорные листы фото работ (пул процессов, кэш по хэшу файла)
+        previews=PreviewService(db, blob_storage),
+        # Задержка цикла событий и места, где его блокирует синхронный код (/lag)
+        watchdog=LoopWatchdog(metrics=metrics),
+        # Профили CPU и памяти работающего бота по командам преподавателя
+        profiler=Profiler(sender),
+    )
+    return dp
+
+async def main():
+    """Запуск бота"""
+    # Настройка логирования: запись на диск в отдельном потоке, ротация и сжатие
+    setup_logging()
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp = create_dispatcher(bot)
+    await db.init()
+    await dp["broadcaster"].resume()
+    await dp["reminders"].start()
+    dp["previews"].start()
+    dp["watchdog"].start()
+    metrics_runner = await start_metrics_server(dp["metrics"])
+    try:
+        logger.info(f"Бот запущен (режим: {BOT_MODE})")
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await dp["profiler"].close()
+        await dp["watchdog"].close()
+        await dp["reminders"].close()
+        await dp["exporter"].close()
+        await dp["previews"].close()
+        await dp["broadcaster"].close()
+        await dp["sender"].close()
+        await db.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
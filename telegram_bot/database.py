@@ -4,266 +4,523 @@
 Модуль для работы с базой данных
 """
 
+import asyncio
 import sqlite3
+import time
 import aiosqlite
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 import logging
 
+import migrations
+from config import (
+    DB_POOL_SIZE, DB_BUSY_TIMEOUT, DB_COMMIT_INTERVAL, DB_WRITE_BATCH,
+    USER_CACHE_SIZE, USER_CACHE_TTL, PAGE_SIZE, DB_CHECK_QUERY_PLANS
+)
+from utils.cache import TTLCache, MISSING
+from utils.membership import MembershipIndex
+from utils.intervals import ScheduleConflicts
+from utils.querystats import QueryStats, TimedConnection, caller_method
+from records import User, Group, Homework, Submission, ScheduleEntry
+
 logger = logging.getLogger(__name__)
 
+# Прагмы, которые применяются один раз при открытии каждого соединения пула
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}",
+)
+# Напоминаний в одном INSERT (по 3 параметра на строку)
+REMINDER_CLAIM_CHUNK = 500
+
 class Database:
-    def __init__(self, db_path="bot_database.db"):
+    # Методы, которые выполняются почти на каждое действие пользователя:
+    # в режиме проверки планов их запросы не должны просматривать таблицы целиком
+    HOT_METHODS = (
+        "get_user", "get_user_groups", "get_user_homework", "get_user_homework_page",
+        "get_homework_details", "get_user_schedule", "get_group_members",
+        "get_homework_submissions", "get_submission", "get_fsm_record",
+    )
+
+    def __init__(self, db_path="bot_database.db", pool_size=DB_POOL_SIZE, check_plans=DB_CHECK_QUERY_PLANS):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self._pool = None
+        self._connections = []
+        self._pool_lock = asyncio.Lock()
+        # Единственный писатель: очередь записей, групповой коммит
+        self._write_queue = None
+        self._writer_task = None
+        self._writer_conn = None
+        self._writer_executor = None
+        # Кэш пользователей по Telegram user_id (роль проверяется на каждом действии)
+        self.user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self._user_cache_epoch = 0
+        # Копия group_members: запросы ученика подставляют id его групп напрямую
+        self.members = MembershipIndex()
+        # Интервалы занятий: новое занятие проверяется на пересечения перед вставкой
+        self.schedule_index = ScheduleConflicts(self)
+        # Проверка пересечений и вставка занятия выполняются без чередования
+        self._schedule_lock = asyncio.Lock()
+        # Подписчики на события изменения данных: событие -> [callback]
+        self._listeners = {}
+        # Время SQL-запросов по методам, журнал медленных запросов
+        self.query_stats = QueryStats(check_plans=check_plans, hot_methods=self.HOT_METHODS)
+
+    async def _open_connection(self):
+        """Открыть соединение и применить прагмы"""
+        db = await aiosqlite.connect(self.db_path)
+        for pragma in CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+        return db
+
+    async def _open_pool(self):
+        """Открыть пул постоянных соединений (если ещё не открыт)"""
+        async with self._pool_lock:
+            if self._pool is not None:
+                return
+            pool = asyncio.Queue(maxsize=self.pool_size)
+            try:
+                for _ in range(self.pool_size):
+                    db = await self._open_connection()
+                    self._connections.append(db)
+                    pool.put_nowait(db)
+            except Exception:
+                await self._close_connections()
+                raise
+            self._pool = pool
+            await self._start_writer()
+            logger.info(f"Открыт пул соединений с БД ({self.pool_size} шт.)")
+
+    async def _start_writer(self):
+        """Запустить задачу-писателя со своим соединением и потоком"""
+        loop = asyncio.get_running_loop()
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._writer_conn = await loop.run_in_executor(self._writer_executor, self._open_writer_connection)
+        self._write_queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+
+    def _open_writer_connection(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _close_writer_connection(self):
+        # Обновляем статистику планировщика для новых индексов
+        try:
+            self._writer_conn.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            logger.warning(f"PRAGMA optimize не выполнен: {e}")
+        self._writer_conn.close()
+
+    async def _stop_writer(self):
+        """Дописать очередь и остановить писателя"""
+        if self._writer_task is None:
+            return
+        await self._write_queue.put(None)
+        await self._writer_task
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._writer_executor, self._close_writer_connection)
+        self._writer_executor.shutdown(wait=True)
+        self._writer_task = None
+        self._writer_conn = None
+        self._writer_executor = None
+        self._write_queue = None
+
+    async def _writer_loop(self):
+        """Собирать записи в пачки и коммитить их одной транзакцией"""
+        loop = asyncio.get_running_loop()
+        queue = self._write_queue
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                break
+            # Даём соседним обработчикам несколько миллисекунд добавить свои записи
+            await asyncio.sleep(DB_COMMIT_INTERVAL)
+            batch = [item]
+            while len(batch) < DB_WRITE_BATCH and not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                results = await loop.run_in_executor(
+                    self._writer_executor, self._apply_batch, [(statements, method) for statements, method, _ in batch]
+                )
+            except Exception as e:
+                logger.error(f"Ошибка группового коммита ({len(batch)} записей): {e}")
+                results = [(None, e)] * len(batch)
+
+            for (_, _, future), (result, error) in zip(batch, results):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def _apply_batch(self, batch):
+        """Выполнить пачку записей в одной транзакции (в потоке писателя)
+
+        Каждая запись изолирована точкой сохранения: ошибка одной записи
+        откатывает только её, остальные попадают в общий коммит.
+        """
+        conn = self._writer_conn
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statements, method in batch:
+                conn.execute("SAVEPOINT write_item")
+                try:
+                    lastrowid, rowcount, returned = None, 0, []
+                    for sql, params in statements:
+                        started = time.perf_counter()
+                        cursor = conn.execute(sql, params)
+                        # Строки RETURNING (для прочих запросов — пустой список)
+                        returned.extend(cursor.fetchall())
+                        self._record_write(conn, method, sql, params, time.perf_counter() - started)
+                        if lastrowid is None:
+                            lastrowid = cursor.lastrowid
+                        rowcount += max(cursor.rowcount, 0)
+                    conn.execute("RELEASE write_item")
+                    results.append(((lastrowid, rowcount, returned), None))
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO write_item")
+                    conn.execute("RELEASE write_item")
+                    results.append((None, e))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def _record_write(self, conn, method, sql, params, elapsed):
+        """Учесть запрос писателя; для медленного получить план (в потоке писателя)"""
+        if not self.query_stats.record(method, sql, elapsed):
+            return
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось получить план запроса из {method}: {e}")
+            return
+        self.query_stats.plan_collected(method, sql, params, elapsed, rows)
+
+    async def _submit_write(self, statements):
+        """Поставить в очередь писателя несколько запросов, выполняемых атомарно
+
+        Возвращает (lastrowid первого запроса, число изменённых строк,
+        строки RETURNING всех запросов) после коммита.
+        """
+        if self._pool is None:
+            await self._open_pool()
+        method = caller_method()
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((statements, method, future))
+        return await future
+
+    async def _write_many(self, statements):
+        """Выполнить несколько изменяющих запросов атомарно, вернуть lastrowid первого
+
+        Первый запрос — основная вставка; следующие могут ссылаться на её
+        строку через last_insert_rowid().
+        """
+        lastrowid, _, _ = await self._submit_write(statements)
+        return lastrowid
+
+    async def _write(self, sql, params=()):
+        """Выполнить изменяющий запрос через писателя"""
+        return await self._write_many([(sql, params)])
+
+    async def _write_count(self, sql, params=()):
+        """Выполнить изменяющий запрос через писателя, вернуть число изменённых строк"""
+        _, rowcount, _ = await self._submit_write([(sql, params)])
+        return rowcount
+
+    async def _write_returning(self, statements):
+        """Выполнить запросы с RETURNING атомарно, вернуть их строки"""
+        _, _, rows = await self._submit_write(statements)
+        return rows
+
+    async def _close_connections(self):
+        for db in self._connections:
+            try:
+                await db.close()
+            except Exception as e:
+                logger.warning(f"Ошибка при закрытии соединения с БД: {e}")
+        self._connections = []
+
+    @asynccontextmanager
+    async def _connection(self):
+        """Взять соединение из пула на время запроса"""
+        if self._pool is None:
+            await self._open_pool()
+        pool = self._pool
+        db = await pool.get()
+        try:
+            # Запросы замеряются и относятся к вызвавшему методу
+            yield TimedConnection(db, self.query_stats)
+        finally:
+            if db.in_transaction:
+                await db.rollback()
+            pool.put_nowait(db)
 
     async def init(self):
         """Инициализация базы данных"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Таблица пользователей
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY,
-                    user_id INTEGER UNIQUE NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    role TEXT DEFAULT 'student',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+        await self._open_pool()
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(
+            self._writer_executor, migrations.migrate, self._writer_conn
+        )
+        self.members.load(await self.get_all_group_memberships())
+        self.schedule_index.load(await self.get_all_schedule_entries())
+        logger.info(f"База данных инициализирована (версия схемы {version})")
 
-            # Таблица групп
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS groups (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+    def subscribe(self, event, callback):
+        """Подписаться на событие изменения данных
 
-            # Таблица участников групп
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS group_members (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER,
-                    user_id INTEGER,
-                    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (group_id) REFERENCES groups (id),
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
+        callback(**payload) вызывается синхронно после коммита записи;
+        длительную работу подписчик должен запускать отдельной задачей.
+        """
+        self._listeners.setdefault(event, []).append(callback)
 
-            # Таблица домашних заданий
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS homework (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    group_id INTEGER,
-                    user_id INTEGER,
-                    due_date TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (group_id) REFERENCES groups (id),
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
+    def _emit(self, event, **payload):
+        for callback in self._listeners.get(event, ()):
+            try:
+                callback(**payload)
+            except Exception:
+                logger.exception(f"Ошибка в обработчике события {event}")
 
-            # Таблица сданных работ
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS submissions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    homework_id INTEGER,
-                    user_id INTEGER,
-                    file_path TEXT,
-                    text_content TEXT,
-                    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    grade INTEGER,
-                    feedback TEXT,
-                    FOREIGN KEY (homework_id) REFERENCES homework (id),
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            """)
+    @staticmethod
+    def _in_clause(column, ids):
+        """Условие «column IN (?, ...)» и параметры; для пустого списка — ложное условие
 
-            # Таблица расписания
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS schedule (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    group_id INTEGER,
-                    day_of_week INTEGER,
-                    time TEXT,
-                    duration INTEGER DEFAULT 60,
-                    subject TEXT DEFAULT 'Английский язык',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id),
-                    FOREIGN KEY (group_id) REFERENCES groups (id)
-                )
-            """)
+        Пустой список даёт «column IN (NULL)», а не константу 0: с ней
+        «user_id = ? OR 0» планировщик решает просмотром всей таблицы.
+        """
+        if not ids:
+            return f"{column} IN (NULL)", []
+        return f"{column} IN ({', '.join('?' * len(ids))})", list(ids)
 
-            await db.commit()
-            logger.info("База данных инициализирована")
+    def _invalidate_user(self, user_id):
+        """Сбросить кэшированную запись пользователя"""
+        self._user_cache_epoch += 1
+        self.user_cache.invalidate(user_id)
 
     async def add_user(self, user_id, username, first_name, last_name):
         """Добавить пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
+        try:
+            await self._write("""
                 INSERT OR REPLACE INTO users (user_id, username, first_name, last_name)
                 VALUES (?, ?, ?, ?)
             """, (user_id, username, first_name, last_name))
-            await db.commit()
+        finally:
+            self._invalidate_user(user_id)
 
     async def get_user(self, user_id):
         """Получить пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        user = self.user_cache.get(user_id)
+        if user is not MISSING:
+            return user
+        # Если за время запроса запись инвалидировали, результат не кэшируем
+        epoch = self._user_cache_epoch
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT * FROM users WHERE user_id = ?
             """, (user_id,))
-            row = await cursor.fetchone()
-            if row:
-                return {
-                    "id": row[0], "user_id": row[1], "username": row[2],
-                    "first_name": row[3], "last_name": row[4], "role": row[5]
-                }
-            return None
+            cursor.row_factory = User.row_factory
+            user = await cursor.fetchone()
+        if epoch == self._user_cache_epoch:
+            self.user_cache.set(user_id, user)
+        return user
 
     async def set_user_role(self, user_id, role):
         """Установить роль пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
+        try:
+            await self._write("""
                 UPDATE users SET role = ? WHERE user_id = ?
             """, (role, user_id))
-            await db.commit()
+        finally:
+            self._invalidate_user(user_id)
 
     async def create_group(self, name, description=""):
         """Создать группу"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                INSERT INTO groups (name, description) VALUES (?, ?)
-            """, (name, description))
-            await db.commit()
-            return cursor.lastrowid
+        return await self._write("""
+            INSERT INTO groups (name, description) VALUES (?, ?)
+        """, (name, description))
 
     async def get_all_groups(self):
         """Получить все группы"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
-                SELECT g.*, COUNT(gm.user_id) as member_count
-                FROM groups g
-                LEFT JOIN group_members gm ON g.id = gm.group_id
-                GROUP BY g.id
-                ORDER BY g.created_at DESC
+                SELECT id, name, description, created_at, member_count
+                FROM groups
+                ORDER BY created_at DESC
             """)
-            rows = await cursor.fetchall()
-            return [{
-                "id": row[0], "name": row[1], "description": row[2],
-                "created_at": row[3], "member_count": row[4]
-            } for row in rows]
+            cursor.row_factory = Group.row_factory
+            return await cursor.fetchall()
 
     async def get_user_groups(self, user_id):
         """Получить группы пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        group_ids = self.members.groups_of(user_id)
+        if not group_ids:
+            return []
+        in_groups, params = self._in_clause("id", group_ids)
+        async with self._connection() as db:
+            cursor = await db.execute(f"""
+                SELECT id, name, description, created_at, member_count
+                FROM groups
+                WHERE {in_groups}
+            """, params)
+            cursor.row_factory = Group.row_factory
+            return await cursor.fetchall()
+
+    async def get_all_groups_page(self, after_id=None, before_id=None, limit=PAGE_SIZE):
+        """Страница всех групп (новые первыми)"""
+        op, direction, cursor_id = self._keyset(after_id, before_id, descending=True)
+        where = ""
+        params = []
+        if cursor_id is not None:
+            where = f"WHERE (created_at, id) {op} (SELECT created_at, id FROM groups WHERE id = ?)"
+            params.append(cursor_id)
+        async with self._connection() as db:
+            cursor = await db.execute(f"""
+                SELECT id, name, description, created_at, member_count
+                FROM groups
+                {where}
+                ORDER BY created_at {direction}, id {direction}
+                LIMIT ?
+            """, (*params, limit + 1))
+            cursor.row_factory = Group.row_factory
+            items = await cursor.fetchall()
+            return self._page(items, limit, after_id, before_id)
+
+    async def check_member_counts(self):
+        """Найти группы, у которых счётчик участников расходится с group_members
+
+        Возвращает список словарей group_id / stored / actual.
+        """
+        async with self._connection() as db:
             cursor = await db.execute("""
-                SELECT g.*, COUNT(gm2.user_id) as member_count
+                SELECT g.id, g.member_count, COUNT(gm.id) as actual
                 FROM groups g
-                JOIN group_members gm ON g.id = gm.group_id
-                LEFT JOIN group_members gm2 ON g.id = gm2.group_id
-                WHERE gm.user_id = ?
+                LEFT JOIN group_members gm ON g.id = gm.group_id
                 GROUP BY g.id
-            """, (user_id,))
+                HAVING g.member_count != actual
+            """)
             rows = await cursor.fetchall()
-            return [{
-                "id": row[0], "name": row[1], "description": row[2],
-                "created_at": row[3], "member_count": row[4]
-            } for row in rows]
+            return [{"group_id": row[0], "stored": row[1], "actual": row[2]} for row in rows]
+
+    async def repair_member_counts(self):
+        """Пересчитать счётчики участников у расходящихся групп
+
+        Возвращает список исправленных расхождений.
+        """
+        mismatches = await self.check_member_counts()
+        if mismatches:
+            await self._write_many([("""
+                UPDATE groups SET member_count = (
+                    SELECT COUNT(*) FROM group_members gm WHERE gm.group_id = groups.id
+                ) WHERE id = ?
+            """, (item["group_id"],)) for item in mismatches])
+            logger.warning(f"Исправлены счётчики участников у {len(mismatches)} групп")
+        return mismatches
 
     async def add_user_to_group(self, group_id, user_id):
         """Добавить пользователя в группу"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR IGNORE INTO group_members (group_id, user_id) VALUES (?, ?)
-            """, (group_id, user_id))
-            await db.commit()
+        added = await self._write_count("""
+            INSERT OR IGNORE INTO group_members (group_id, user_id) VALUES (?, ?)
+        """, (group_id, user_id))
+        if added:
+            self.members.add(group_id, user_id)
+            self._emit("group_member_added", group_id=group_id, user_id=user_id)
 
     async def get_group_members(self, group_id):
         """Получить участников группы"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT u.user_id, u.first_name, u.last_name, u.username
                 FROM users u
                 JOIN group_members gm ON u.user_id = gm.user_id
                 WHERE gm.group_id = ?
             """, (group_id,))
-            rows = await cursor.fetchall()
-            return [{
-                "user_id": row[0], "first_name": row[1],
-                "last_name": row[2], "username": row[3]
-            } for row in rows]
+            cursor.row_factory = User.row_factory
+            return await cursor.fetchall()
 
     async def get_group_info(self, group_id):
         """Получить информацию о группе"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT * FROM groups WHERE id = ?
             """, (group_id,))
-            row = await cursor.fetchone()
-            if row:
-                return {
-                    "id": row[0], "name": row[1], "description": row[2], "created_at": row[3]
-                }
-            return None
+            cursor.row_factory = Group.row_factory
+            return await cursor.fetchone()
 
     async def create_homework(self, title, description, group_id=None, user_id=None, due_date=None):
-        """Создать домашнее задание"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                INSERT INTO homework (title, description, group_id, user_id, due_date)
-                VALUES (?, ?, ?, ?, ?)
-            """, (title, description, group_id, user_id, due_date))
-            await db.commit()
-            return cursor.lastrowid
+        """Создать домашнее задание
+
+        В той же транзакции создаются записи доставки объявления всем
+        получателям: рассылка, прерванная падением бота, продолжается по ним.
+        """
+        homework_id = await self._write_many([("""
+            INSERT INTO homework (title, description, group_id, user_id, due_date)
+            VALUES (?, ?, ?, ?, ?)
+        """, (title, description, group_id, user_id, due_date)), ("""
+            INSERT OR IGNORE INTO homework_deliveries (homework_id, user_id)
+            SELECT h.id, gm.user_id
+            FROM homework h
+            JOIN group_members gm ON gm.group_id = h.group_id
+            WHERE h.id = last_insert_rowid()
+            UNION
+            SELECT h.id, h.user_id
+            FROM homework h
+            WHERE h.id = last_insert_rowid() AND h.user_id IS NOT NULL
+        """, ())])
+        self._emit(
+            "homework_created", homework_id=homework_id, title=title,
+            group_id=group_id, user_id=user_id, due_date=due_date
+        )
+        return homework_id
 
     async def get_user_homework(self, user_id):
         """Получить домашние задания пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
+        in_groups, group_params = self._in_clause("h.group_id", self.members.groups_of(user_id))
+        async with self._connection() as db:
+            cursor = await db.execute(f"""
                 SELECT h.*, s.grade, s.submitted_at,
                        CASE WHEN s.id IS NOT NULL THEN 'submitted' ELSE 'pending' END as status
                 FROM homework h
                 LEFT JOIN submissions s ON h.id = s.homework_id AND s.user_id = ?
-                WHERE h.user_id = ? OR h.group_id IN (
-                    SELECT group_id FROM group_members WHERE user_id = ?
-                )
+                WHERE h.user_id = ? OR {in_groups}
                 ORDER BY h.due_date ASC
-            """, (user_id, user_id, user_id))
-            rows = await cursor.fetchall()
-            return [{
-                "id": row[0], "title": row[1], "description": row[2],
-                "group_id": row[3], "user_id": row[4], "due_date": row[5],
-                "created_at": row[6], "grade": row[7], "submitted_at": row[8], "status": row[9]
-            } for row in rows]
-
-    async def get_homework_details(self, homework_id):
-        """Получить детали домашнего задания"""
-        async with aiosqlite.connect(self.db_path) as db:
+            """, (user_id, user_id, *group_params))
+            cursor.row_factory = Homework.row_factory
+            return await cursor.fetchall()
+
+    async def get_homework_details(self, homework_id, user_id=None):
+        """Получить детали домашнего задания (со статусом работы ученика user_id)"""
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT h.*, s.grade, s.submitted_at,
                        CASE WHEN s.id IS NOT NULL THEN 'submitted' ELSE 'pending' END as status
                 FROM homework h
-                LEFT JOIN submissions s ON h.id = s.homework_id
+                LEFT JOIN submissions s ON h.id = s.homework_id AND (? IS NULL OR s.user_id = ?)
                 WHERE h.id = ?
-            """, (homework_id,))
-            row = await cursor.fetchone()
-            if row:
-                return {
-                    "id": row[0], "title": row[1], "description": row[2],
-                    "group_id": row[3], "user_id": row[4], "due_date": row[5],
-                    "created_at": row[6], "grade": row[7], "submitted_at": row[8], "status": row[9]
-                }
-            return None
+            """, (user_id, user_id, homework_id))
+            cursor.row_factory = Homework.row_factory
+            return await cursor.fetchone()
 
     async def get_all_homework(self):
         """Получить все домашние задания"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 SELECT h.*, COUNT(s.id) as submission_count
                 FROM homework h
@@ -271,60 +528,399 @@ class Database:
                 GROUP BY h.id
                 ORDER BY h.created_at DESC
             """)
+            cursor.row_factory = Homework.row_factory
+            return await cursor.fetchall()
+
+    @staticmethod
+    def _keyset(after_id, before_id, descending):
+        """Условие и направление сортировки для keyset-пагинации
+
+        Возвращает (оператор сравнения, направление ORDER BY, id-курсор).
+        Для страницы «назад» порядок обращается, а строки потом разворачиваются.
+        """
+        backward = before_id is not None
+        forward_op, backward_op = ("<", ">") if descending else (">", "<")
+        forward_dir, backward_dir = ("DESC", "ASC") if descending else ("ASC", "DESC")
+        if backward:
+            return backward_op, backward_dir, before_id
+        return forward_op, forward_dir, after_id
+
+    @staticmethod
+    def _page(items, limit, after_id, before_id):
+        """Оформить страницу из limit + 1 выбранных строк"""
+        has_more = len(items) > limit
+        items = items[:limit]
+        if before_id is not None:
+            items.reverse()
+            has_prev, has_next = has_more, True
+        else:
+            has_prev, has_next = after_id is not None, has_more
+        return {
+            "items": items,
+            "prev_id": items[0]["id"] if items and has_prev else None,
+            "next_id": items[-1]["id"] if items and has_next else None,
+        }
+
+    async def get_all_homework_page(self, after_id=None, before_id=None, limit=PAGE_SIZE):
+        """Страница всех домашних заданий (новые первыми)
+
+        after_id / before_id — id последнего / первого задания соседней страницы.
+        """
+        op, direction, cursor_id = self._keyset(after_id, before_id, descending=True)
+        where = ""
+        params = []
+        if cursor_id is not None:
+            where = f"WHERE (h.created_at, h.id) {op} (SELECT created_at, id FROM homework WHERE id = ?)"
+            params.append(cursor_id)
+        async with self._connection() as db:
+            cursor = await db.execute(f"""
+                SELECT h.id, h.title, h.description, h.group_id, h.user_id, h.due_date, h.created_at,
+                       (SELECT COUNT(*) FROM submissions s WHERE s.homework_id = h.id) as submission_count
+                FROM homework h
+                {where}
+                ORDER BY h.created_at {direction}, h.id {direction}
+                LIMIT ?
+            """, (*params, limit + 1))
+            cursor.row_factory = Homework.row_factory
+            items = await cursor.fetchall()
+            return self._page(items, limit, after_id, before_id)
+
+    async def get_user_homework_page(self, user_id, after_id=None, before_id=None, limit=PAGE_SIZE):
+        """Страница домашних заданий пользователя (ближайший срок первым)"""
+        op, direction, cursor_id = self._keyset(after_id, before_id, descending=False)
+        keyset = ""
+        in_groups, group_params = self._in_clause("h.group_id", self.members.groups_of(user_id))
+        params = [user_id, user_id, *group_params]
+        if cursor_id is not None:
+            keyset = f"""AND (COALESCE(h.due_date, ''), h.id) {op} (
+                    SELECT COALESCE(due_date, ''), id FROM homework WHERE id = ?
+                )"""
+            params.append(cursor_id)
+        async with self._connection() as db:
+            cursor = await db.execute(f"""
+                SELECT h.id, h.title, h.description, h.group_id, h.user_id, h.due_date, h.created_at,
+                       s.grade, s.submitted_at,
+                       CASE WHEN s.id IS NOT NULL THEN 'submitted' ELSE 'pending' END as status
+                FROM homework h
+                LEFT JOIN submissions s ON h.id = s.homework_id AND s.user_id = ?
+                WHERE (h.user_id = ? OR {in_groups})
+                {keyset}
+                ORDER BY COALESCE(h.due_date, '') {direction}, h.id {direction}
+                LIMIT ?
+            """, (*params, limit + 1))
+            cursor.row_factory = Homework.row_factory
+            items = await cursor.fetchall()
+            return self._page(items, limit, after_id, before_id)
+
+    async def submit_homework(self, homework_id, user_id, text_content=None, file_name=None,
+                              file_size=None, file_id=None, file_unique_id=None, file_type=None):
+        """Сдать домашнее задание
+
+        Файл работы хранится в Telegram (file_id, file_unique_id, file_type —
+        'document' или 'photo'), file_size — его размер. SHA-256 файла
+        проставляется позже, когда он впервые скачивается в кэш.
+        """
+        await self._write("""
+            INSERT OR REPLACE INTO submissions
+                (homework_id, user_id, text_content, file_name, file_size,
+                 file_id, file_unique_id, file_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (homework_id, user_id, text_content, file_name, file_size,
+              file_id, file_unique_id, file_type))
+        self._emit("submission_changed", homework_id=homework_id, user_id=user_id)
+
+    async def get_student_storage_used(self, user_id, exclude_homework_id=None):
+        """Объём файлов работ ученика в байтах (одинаковые файлы считаются один раз)"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT COALESCE(SUM(file_size), 0) FROM (
+                    SELECT DISTINCT file_unique_id, file_size FROM submissions
+                    WHERE user_id = ? AND file_unique_id IS NOT NULL
+                      AND homework_id IS NOT ?
+                )
+            """, (user_id, exclude_homework_id))
+            row = await cursor.fetchone()
+            return row[0]
+
+    async def set_submission_file_hash(self, file_unique_id, file_hash):
+        """Запомнить SHA-256 скачанного файла для всех работ с этим file_unique_id"""
+        await self._write("""
+            UPDATE submissions SET file_hash = ? WHERE file_unique_id = ?
+        """, (file_hash, file_unique_id))
+
+    async def get_homework_submissions(self, homework_id):
+        """Работы по заданию с именами учеников (новые первыми)"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT s.*, u.first_name, u.last_name, u.username
+                FROM submissions s
+                LEFT JOIN users u ON u.user_id = s.user_id
+                WHERE s.homework_id = ?
+                ORDER BY s.submitted_at DESC, s.id DESC
+            """, (homework_id,))
+            cursor.row_factory = Submission.row_factory
+            return await cursor.fetchall()
+
+    async def get_submission(self, submission_id):
+        """Работа с именем ученика и названием задания"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT s.*, u.first_name, u.last_name, u.username, h.title as homework_title
+                FROM submissions s
+                LEFT JOIN users u ON u.user_id = s.user_id
+                LEFT JOIN homework h ON h.id = s.homework_id
+                WHERE s.id = ?
+            """, (submission_id,))
+            cursor.row_factory = Submission.row_factory
+            return await cursor.fetchone()
+
+    async def get_referenced_file_hashes(self):
+        """Хэши всех скачанных файлов, на которые ссылаются сданные работы"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT DISTINCT file_hash FROM submissions WHERE file_hash IS NOT NULL
+            """)
             rows = await cursor.fetchall()
-            return [{
-                "id": row[0], "title": row[1], "description": row[2],
-                "group_id": row[3], "user_id": row[4], "due_date": row[5],
-                "created_at": row[6], "submission_count": row[7]
-            } for row in rows]
-
-    async def submit_homework(self, homework_id, user_id, file_path=None, text_content=None):
-        """Сдать домашнее задание"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO submissions (homework_id, user_id, file_path, text_content)
-                VALUES (?, ?, ?, ?)
-            """, (homework_id, user_id, file_path, text_content))
-            await db.commit()
+            return {row[0] for row in rows}
+
+    async def count_disk_only_submissions(self):
+        """Работы, чей файл есть только на диске (file_path без file_id)
+
+        None, если колонки file_path уже нет.
+        """
+        async with self._connection() as db:
+            cursor = await db.execute("SELECT name FROM pragma_table_info('submissions')")
+            if "file_path" not in {row[0] for row in await cursor.fetchall()}:
+                return None
+            cursor = await db.execute("""
+                SELECT COUNT(*) FROM submissions WHERE file_path IS NOT NULL AND file_id IS NULL
+            """)
+            row = await cursor.fetchone()
+            return row[0]
+
+    async def drop_submission_file_path(self):
+        """Удалить колонку file_path (только когда на неё не опирается ни одна работа)"""
+        await self._write("ALTER TABLE submissions DROP COLUMN file_path")
 
     async def set_grade(self, homework_id, user_id, grade, feedback=None):
         """Поставить оценку"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                UPDATE submissions SET grade = ?, feedback = ?
-                WHERE homework_id = ? AND user_id = ?
-            """, (grade, feedback, homework_id, user_id))
-            await db.commit()
+        updated = await self._write_count("""
+            UPDATE submissions SET grade = ?, feedback = ?
+            WHERE homework_id = ? AND user_id = ?
+        """, (grade, feedback, homework_id, user_id))
+        if updated:
+            self._emit("submission_changed", homework_id=homework_id, user_id=user_id)
 
     async def create_schedule_entry(self, user_id, group_id, day_of_week, time, duration=60):
-        """Создать запись в расписании"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
+        """Создать запись в расписании
+
+        Занятие, пересекающееся с уже назначенными, не создаётся: ScheduleConflict
+        с пересечениями и свободными слотами. Проверка и вставка идут под
+        блокировкой, так что из двух одновременных занятий проходит одно.
+        """
+        async with self._schedule_lock:
+            self.schedule_index.check(user_id, group_id, day_of_week, time, duration)
+            entry_id = await self._write("""
                 INSERT INTO schedule (user_id, group_id, day_of_week, time, duration)
                 VALUES (?, ?, ?, ?, ?)
             """, (user_id, group_id, day_of_week, time, duration))
-            await db.commit()
-            return cursor.lastrowid
+            # Предмет (значение по умолчанию схемы) и название группы — из самой строки
+            entry = await self.get_schedule_entry(entry_id)
+            self.schedule_index.add(entry)
+        self._emit(
+            "schedule_created", entry_id=entry_id, user_id=user_id, group_id=group_id,
+            day_of_week=day_of_week, time=time, duration=duration,
+            subject=entry['subject'], group_name=entry['group_name']
+        )
+        return entry_id
+
+    async def get_schedule_entry(self, entry_id):
+        """Получить запись расписания с названием группы"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT s.id, s.user_id, s.group_id, s.day_of_week, s.time, s.duration,
+                       s.subject, g.name as group_name
+                FROM schedule s
+                LEFT JOIN groups g ON s.group_id = g.id
+                WHERE s.id = ?
+            """, (entry_id,))
+            cursor.row_factory = ScheduleEntry.row_factory
+            return await cursor.fetchone()
 
     async def get_user_schedule(self, user_id):
         """Получить расписание пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
+        in_groups, group_params = self._in_clause("s.group_id", self.members.groups_of(user_id))
+        async with self._connection() as db:
+            cursor = await db.execute(f"""
                 SELECT s.*, g.name as group_name
                 FROM schedule s
                 LEFT JOIN groups g ON s.group_id = g.id
-                WHERE s.user_id = ? OR s.group_id IN (
-                    SELECT group_id FROM group_members WHERE user_id = ?
-                )
+                WHERE s.user_id = ? OR {in_groups}
                 ORDER BY s.day_of_week, s.time
-            """, (user_id, user_id))
+            """, (user_id, *group_params))
+            cursor.row_factory = ScheduleEntry.row_factory
+            return await cursor.fetchall()
+
+    async def get_pending_deliveries(self, homework_id, after_user_id=0, limit=1000):
+        """Получатели, которым объявление ещё не доставлено (порциями по user_id)"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT user_id FROM homework_deliveries
+                WHERE homework_id = ? AND status = 'pending' AND user_id > ?
+                ORDER BY user_id
+                LIMIT ?
+            """, (homework_id, after_user_id, limit))
+            rows = await cursor.fetchall()
+            return [row[0] for row in rows]
+
+    async def get_homework_with_pending_deliveries(self):
+        """Задания с незавершённой рассылкой (для возобновления после перезапуска)"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT DISTINCT homework_id FROM homework_deliveries WHERE status = 'pending'
+            """)
+            rows = await cursor.fetchall()
+            return [row[0] for row in rows]
+
+    async def mark_delivery(self, homework_id, user_id, status, error=None):
+        """Отметить результат доставки объявления получателю"""
+        await self._write("""
+            UPDATE homework_deliveries
+            SET status = ?, error = ?, attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE homework_id = ? AND user_id = ?
+        """, (status, error, homework_id, user_id))
+
+    async def get_delivery_stats(self, homework_id):
+        """Количество получателей по статусам доставки"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT status, COUNT(*) FROM homework_deliveries
+                WHERE homework_id = ?
+                GROUP BY status
+            """, (homework_id,))
+            rows = await cursor.fetchall()
+            stats = {"pending": 0, "sent": 0, "failed": 0}
+            stats.update({row[0]: row[1] for row in rows})
+            return stats
+
+    async def get_all_schedule_entries(self):
+        """Все записи расписания (для индекса пересечений и планировщика напоминаний)"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT s.id, s.user_id, s.group_id, s.day_of_week, s.time, s.duration,
+                       s.subject, g.name as group_name
+                FROM schedule s
+                LEFT JOIN groups g ON s.group_id = g.id
+            """)
+            cursor.row_factory = ScheduleEntry.row_factory
+            return await cursor.fetchall()
+
+    async def get_all_group_memberships(self):
+        """Все пары (group_id, user_id) из group_members"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT group_id, user_id FROM group_members
+            """)
+            return await cursor.fetchall()
+
+    async def get_homework_with_due_dates(self):
+        """Задания с указанным сроком сдачи (для планировщика напоминаний)"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT id, title, group_id, user_id, due_date
+                FROM homework
+                WHERE due_date IS NOT NULL AND due_date != ''
+            """)
+            cursor.row_factory = Homework.row_factory
+            return await cursor.fetchall()
+
+    async def get_lesson_recipients(self, user_id, group_id):
+        """Telegram id учеников занятия: индивидуального или всей группы"""
+        recipients = {user_id} if user_id else set()
+        if group_id:
+            recipients.update(self.members.users_of(group_id))
+        return sorted(recipients)
+
+    async def get_homework_pending_recipients(self, homework_id):
+        """Получатели задания, которые ещё не сдали работу"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT r.user_id FROM (
+                    SELECT gm.user_id FROM homework h
+                    JOIN group_members gm ON gm.group_id = h.group_id
+                    WHERE h.id = ?
+                    UNION
+                    SELECT h.user_id FROM homework h
+                    WHERE h.id = ? AND h.user_id IS NOT NULL
+                ) r
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM submissions s
+                    WHERE s.homework_id = ? AND s.user_id = r.user_id
+                )
+            """, (homework_id, homework_id, homework_id))
             rows = await cursor.fetchall()
-            return [{
-                "id": row[0], "user_id": row[1], "group_id": row[2],
-                "day_of_week": row[3], "time": row[4], "duration": row[5],
-                "subject": row[6], "created_at": row[7], "group_name": row[8]
-            } for row in rows]
+            return [row[0] for row in rows]
+
+    async def claim_reminders(self, reminders):
+        """Отметить пачку напоминаний отправленными одной записью
+
+        reminders — список (kind, ref_id, occurrence). Возвращает множество
+        тех же кортежей, которые удалось отметить: уже отправленные
+        (например, до перезапуска) в него не входят.
+        """
+        statements = []
+        for start in range(0, len(reminders), REMINDER_CLAIM_CHUNK):
+            chunk = reminders[start:start + REMINDER_CLAIM_CHUNK]
+            statements.append((f"""
+                INSERT OR IGNORE INTO sent_reminders (kind, ref_id, occurrence)
+                VALUES {", ".join(["(?, ?, ?)"] * len(chunk))}
+                RETURNING kind, ref_id, occurrence
+            """, [value for reminder in chunk for value in reminder]))
+        if not statements:
+            return set()
+        return {tuple(row) for row in await self._write_returning(statements)}
+
+    async def get_fsm_record(self, key):
+        """Получить сохранённое состояние FSM: (state, data_json, updated_at) или None"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT state, data, updated_at FROM fsm_states WHERE key = ?
+            """, (key,))
+            return await cursor.fetchone()
+
+    async def save_fsm_records(self, records):
+        """Сохранить пачку состояний FSM одной транзакцией
+
+        records — список (key, state, data_json, updated_at);
+        записи с пустым состоянием и данными удаляются.
+        """
+        statements = []
+        for key, state, data, updated_at in records:
+            if state is None and data == "{}":
+                statements.append(("DELETE FROM fsm_states WHERE key = ?", (key,)))
+            else:
+                statements.append(("""
+                    INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at)
+                    VALUES (?, ?, ?, ?)
+                """, (key, state, data, updated_at)))
+        if statements:
+            await self._write_many(statements)
+
+    async def delete_expired_fsm_records(self, older_than):
+        """Удалить состояния FSM, не изменявшиеся с момента older_than (unix time)"""
+        await self._write("""
+            DELETE FROM fsm_states WHERE updated_at < ?
+        """, (older_than,))
 
     async def close(self):
         """Закрыть соединение с базой данных"""
-        pass
\ No newline at end of file
+        async with self._pool_lock:
+            if self._pool is None:
+                return
+            await self._stop_writer()
+            # Дожидаемся возврата всех соединений в пул
+            for _ in range(self.pool_size):
+                await self._pool.get()
+            self._pool = None
+            await self._close_connections()
+            logger.info("Пул соединений с БД закрыт")
\ No newline at end of file
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Записи, которые возвращают методы Database
+
+Строки SQLite превращаются в компактные объекты со __slots__ прямо
+в row_factory курсора: поля сопоставляются по именам колонок запроса,
+а не по позициям. Записи поддерживают и доступ как к словарю
+(record['title'], record.get('grade')), которым пользуется остальной код.
+Поля, которых не было в запросе, равны None; колонки запроса, для которых
+нет поля, не сохраняются.
+"""
+
+
+class Record:
+    """Базовый класс записи: поля перечисляются в __slots__ подкласса"""
+
+    __slots__ = ()
+    _fields = frozenset()
+    # Конструкторы по описанию колонок курсора и последний использованный
+    _builders = {}
+    _last = (None, None)
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(cls.__slots__)
+        cls._builders = {}
+        cls._last = (None, None)
+
+    @classmethod
+    def _builder(cls, description):
+        """Функция row -> запись для данного набора колонок
+
+        Колонки, которых нет в __slots__ (например, новая колонка таблицы
+        в SELECT *), пропускаются.
+        """
+        names = [column[0] if column[0] in cls._fields else None for column in description]
+
+        def build(row):
+            record = object.__new__(cls)
+            for name, value in zip(names, row):
+                if name is not None:
+                    setattr(record, name, value)
+            return record
+
+        return build
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        """row_factory для курсора sqlite3/aiosqlite"""
+        description = cursor.description
+        last_description, build = cls._last
+        # description — один и тот же объект для всех строк результата
+        if description is not last_description:
+            build = cls._builders.get(description)
+            if build is None:
+                build = cls._builders[description] = cls._builder(description)
+            cls._last = (description, build)
+        return build(row)
+
+    def __getattr__(self, name):
+        # Вызывается только для незаполненных полей
+        if name in self._fields:
+            return None
+        raise AttributeError(f"{type(self).__name__} has no field {name!r}")
+
+    def __getitem__(self, name):
+        if name not in self._fields:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __contains__(self, name):
+        return name in self._fields
+
+    def get(self, name, default=None):
+        """Как dict.get; незаполненное поле и NULL считаются отсутствующими"""
+        value = getattr(self, name, None) if name in self._fields else None
+        return default if value is None else value
+
+    def keys(self):
+        return self.__slots__
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__ if getattr(self, name) is not None
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class User(Record):
+    __slots__ = ("id", "user_id", "username", "first_name", "last_name", "role", "created_at")
+
+
+class Group(Record):
+    __slots__ = ("id", "name", "description", "created_at", "member_count")
+
+
+class Homework(Record):
+    __slots__ = (
+        "id", "title", "description", "group_id", "user_id", "due_date", "created_at",
+        # Вычисляемые поля запросов ученика и преподавателя
+        "grade", "submitted_at", "status", "submission_count"
+    )
+
+
+class Submission(Record):
+    __slots__ = (
+        "id", "homework_id", "user_id", "text_content",
+        "submitted_at", "grade", "feedback", "file_name", "file_hash", "file_size",
+        "file_id", "file_unique_id", "file_type",
+        # Поля запросов преподавателя
+        "first_name", "last_name", "username", "homework_title"
+    )
+
+
+class ScheduleEntry(Record):
+    __slots__ = (
+        "id", "user_id", "group_id", "day_of_week", "time", "duration", "subject",
+        "created_at", "group_name"
+    )
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище состояний FSM в SQLite
+
+Состояния диалогов (TeacherStates / StudentStates) переживают перезапуск
+бота. Чтение и запись идут через горячий кэш в памяти, изменения
+сбрасываются на диск пачками раз в FSM_FLUSH_INTERVAL, а диалоги, которые
+не менялись дольше FSM_STATE_TTL, удаляются.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from config import FSM_STATE_TTL, FSM_FLUSH_INTERVAL, FSM_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в периодах сброса) удалять устаревшие состояния
+SWEEP_EVERY = 60
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state=None, data=None, updated_at=0.0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states базы бота с кэшем в памяти"""
+
+    def __init__(self, db, ttl=FSM_STATE_TTL, flush_interval=FSM_FLUSH_INTERVAL, cache_size=FSM_CACHE_SIZE):
+        self.db = db
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._flusher = None
+
+    @staticmethod
+    def _key(key):
+        return (
+            f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+            f"{key.business_connection_id or ''}:{key.destiny}"
+        )
+
+    def _is_expired(self, record):
+        return record.updated_at < time.time() - self.ttl
+
+    async def _get_record(self, key):
+        """Найти запись в кэше, при промахе загрузить из базы"""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+        record = self._cache.get(key)
+        if record is None:
+            row = await self.db.get_fsm_record(key)
+            # Пока шла загрузка, запись могли создать — она новее базы
+            record = self._cache.get(key)
+            if record is None:
+                record = _Record()
+                if row is not None:
+                    record = _Record(row[0], json.loads(row[1]), row[2])
+                self._evict()
+                self._cache[key] = record
+        self._cache.move_to_end(key)
+
+        if record.updated_at and self._is_expired(record):
+            record.state, record.data = None, {}
+            record.updated_at = time.time()
+            self._dirty.add(key)
+        return record
+
+    def _touch(self, key, record):
+        record.updated_at = time.time()
+        self._dirty.add(key)
+
+    def _evict(self):
+        """Освободить место в кэше под новую запись
+
+        Вытесняются только давно не используемые записи, уже сохранённые на диск.
+        """
+        if len(self._cache) < self.cache_size:
+            return
+        for key in list(self._cache):
+            if len(self._cache) < self.cache_size:
+                break
+            if key not in self._dirty:
+                del self._cache[key]
+
+    def state_counts(self):
+        """Сколько незавершённых диалогов в кэше в каждом состоянии"""
+        counts = {}
+        for record in self._cache.values():
+            if record.state is not None and not self._is_expired(record):
+                counts[record.state] = counts.get(record.state, 0) + 1
+        return counts
+
+    async def set_state(self, key, state=None):
+        key = self._key(key)
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key):
+        record = await self._get_record(self._key(key))
+        return record.state
+
+    async def set_data(self, key, data):
+        key = self._key(key)
+        record = await self._get_record(key)
+        record.data = data.copy()
+        self._touch(key, record)
+
+    async def get_data(self, key):
+        record = await self._get_record(self._key(key))
+        return record.data.copy()
+
+    async def flush(self):
+        """Записать все изменённые состояния одной транзакцией"""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        records = []
+        for key in keys:
+            record = self._cache.get(key)
+            if record is not None:
+                records.append((
+                    key, record.state,
+                    json.dumps(record.data, ensure_ascii=False, default=str),
+                    record.updated_at
+                ))
+        try:
+            await self.db.save_fsm_records(records)
+        except Exception as e:
+            logger.error(f"Не удалось сохранить состояния FSM: {e}")
+            self._dirty |= keys
+            return
+        self._evict()
+
+    async def expire(self):
+        """Удалить из памяти и базы состояния старше TTL"""
+        cutoff = time.time() - self.ttl
+        for key in [k for k, r in self._cache.items() if r.updated_at < cutoff]:
+            del self._cache[key]
+            self._dirty.discard(key)
+        await self.db.delete_expired_fsm_records(cutoff)
+
+    async def _flush_loop(self):
+        ticks = 0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            ticks += 1
+            if ticks % SWEEP_EVERY == 0:
+                try:
+                    await self.expire()
+                except Exception as e:
+                    logger.error(f"Ошибка очистки устаревших состояний FSM: {e}")
+
+    async def close(self):
+        """Остановить фоновую запись и сохранить оставшиеся изменения"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
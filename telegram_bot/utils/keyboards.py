@@ -6,6 +6,8 @@
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from config import PAGE_SIZE
+
 def get_main_menu():
     """Главное меню выбора роли"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -35,7 +37,19 @@ def get_teacher_menu():
     ])
     return keyboard
 
-def get_groups_keyboard(groups, is_teacher=False, show_members=False):
+def get_page_buttons(prefix, prev_id=None, next_id=None):
+    """Кнопки перелистывания страниц (пустой список, если листать некуда)
+
+    callback_data: {prefix}_prev_{id} / {prefix}_next_{id}
+    """
+    buttons = []
+    if prev_id is not None:
+        buttons.append(InlineKeyboardButton(text="◀️ Предыдущие", callback_data=f"{prefix}_prev_{prev_id}"))
+    if next_id is not None:
+        buttons.append(InlineKeyboardButton(text="Следующие ▶️", callback_data=f"{prefix}_next_{next_id}"))
+    return buttons
+
+def get_groups_keyboard(groups, is_teacher=False, show_members=False, prev_id=None, next_id=None):
     """Клавиатура для работы с группами"""
     keyboard = []
     
@@ -50,6 +64,10 @@ def get_groups_keyboard(groups, is_teacher=False, show_members=False):
                 )
             ])
         
+        page_buttons = get_page_buttons("groups_page", prev_id, next_id)
+        if page_buttons:
+            keyboard.append(page_buttons)
+        
         keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_teacher")])
     else:
         for group in groups:
@@ -67,14 +85,17 @@ def get_groups_keyboard(groups, is_teacher=False, show_members=False):
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_homework_keyboard(homework_list, is_teacher=False, detailed=False):
-    """Клавиатура для работы с домашними заданиями"""
+def get_homework_keyboard(homework_list, is_teacher=False, detailed=False, prev_id=None, next_id=None):
+    """Клавиатура для работы с домашними заданиями
+
+    homework_list — одна страница заданий; prev_id / next_id — курсоры соседних страниц
+    """
     keyboard = []
     
     if is_teacher:
         keyboard.append([InlineKeyboardButton(text="➕ Создать задание", callback_data="create_homework")])
         
-        for hw in homework_list[:5]:  # Показываем первые 5
+        for hw in homework_list[:PAGE_SIZE]:
             status_emoji = "✅" if hw.get('submission_count', 0) > 0 else "📝"
             keyboard.append([
                 InlineKeyboardButton(
@@ -83,9 +104,13 @@ def get_homework_keyboard(homework_list, is_teacher=False, detailed=False):
                 )
             ])
         
+        page_buttons = get_page_buttons("hw_tpage", prev_id, next_id)
+        if page_buttons:
+            keyboard.append(page_buttons)
+        
         keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_teacher")])
     else:
-        for hw in homework_list[:5]:  # Показываем первые 5
+        for hw in homework_list[:PAGE_SIZE]:
             status_emoji = "✅" if hw['status'] == 'submitted' else "📝"
             grade_text = f" ({hw['grade']}/5)" if hw['grade'] else ""
             keyboard.append([
@@ -95,6 +120,10 @@ def get_homework_keyboard(homework_list, is_teacher=False, detailed=False):
                 )
             ])
         
+        page_buttons = get_page_buttons("hw_page", prev_id, next_id)
+        if page_buttons:
+            keyboard.append(page_buttons)
+        
         if detailed:
             keyboard.append([InlineKeyboardButton(text="📎 Сдать работу", callback_data="submit_homework")])
         
@@ -132,6 +161,55 @@ def get_grade_keyboard(homework_id, user_id):
     ])
     return keyboard
 
+def get_submissions_keyboard(homework_id, submissions, photos=False):
+    """Клавиатура работ по заданию для преподавателя (photos — показать кнопку превью фото)"""
+    keyboard = []
+    for submission in submissions:
+        name = " ".join(filter(None, [submission['first_name'], submission['last_name']])) or str(submission['user_id'])
+        grade_text = f" ({submission['grade']}/5)" if submission['grade'] else ""
+        status_emoji = "✅" if submission['grade'] else "📎"
+        keyboard.append([
+            InlineKeyboardButton(text=f"{status_emoji} {name[:30]}{grade_text}", callback_data=f"sub_{submission['id']}")
+        ])
+    if photos:
+        keyboard.append([InlineKeyboardButton(text="🖼 Просмотр фото", callback_data=f"sheet_{homework_id}_0")])
+    if submissions:
+        keyboard.append([InlineKeyboardButton(text="📦 Скачать все работы", callback_data=f"hw_export_{homework_id}")])
+    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="manage_homework")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_contact_sheet_keyboard(homework_id, start, count, page, pages, columns=3):
+    """Клавиатура обзорного листа: номера фото на листе и листание листов"""
+    numbers = [
+        InlineKeyboardButton(text=str(index + 1), callback_data=f"photo_{homework_id}_{index}")
+        for index in range(start, start + count)
+    ]
+    keyboard = [numbers[i:i + columns] for i in range(0, len(numbers), columns)]
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="◀️ Предыдущие", callback_data=f"sheet_{homework_id}_{page - 1}"))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton(text="Следующие ▶️", callback_data=f"sheet_{homework_id}_{page + 1}"))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton(text="✖️ Закрыть", callback_data="previews_close")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_photo_preview_keyboard(homework_id, index, count, submission_id, page):
+    """Клавиатура превью фото: соседние работы, оценка и возврат к обзорному листу"""
+    navigation = []
+    if index > 0:
+        navigation.append(InlineKeyboardButton(text="◀️", callback_data=f"photo_{homework_id}_{index - 1}"))
+    if index < count - 1:
+        navigation.append(InlineKeyboardButton(text="▶️", callback_data=f"photo_{homework_id}_{index + 1}"))
+    keyboard = [navigation] if navigation else []
+    keyboard.append([
+        InlineKeyboardButton(text="⭐ Оценить", callback_data=f"sub_{submission_id}"),
+        InlineKeyboardButton(text="🗂 Все фото", callback_data=f"sheet_{homework_id}_{page}")
+    ])
+    keyboard.append([InlineKeyboardButton(text="✖️ Закрыть", callback_data="previews_close")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def get_days_keyboard():
     """Клавиатура выбора дней недели"""
     days = [
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Индекс участников групп в памяти
+
+Состав групп меняется редко, а читается почти в каждом запросе ученика.
+Database держит копию group_members в двух словарях (ученик → группы и
+группа → ученики), загружает её при запуске и обновляет после каждой
+записи в group_members. Списки хранятся отсортированными кортежами: они
+в несколько раз компактнее множеств, а изменения состава редки.
+"""
+
+import bisect
+import sys
+
+
+class MembershipIndex:
+    """Двусторонний индекс group_members"""
+
+    def __init__(self):
+        self._user_groups = {}
+        self._group_users = {}
+
+    def load(self, memberships):
+        """Заполнить индекс парами (group_id, user_id)"""
+        user_groups = {}
+        group_users = {}
+        for group_id, user_id in memberships:
+            user_groups.setdefault(user_id, []).append(group_id)
+            group_users.setdefault(group_id, []).append(user_id)
+        self._user_groups = {key: tuple(sorted(set(ids))) for key, ids in user_groups.items()}
+        self._group_users = {key: tuple(sorted(set(ids))) for key, ids in group_users.items()}
+
+    @staticmethod
+    def _insert(mapping, key, value):
+        ids = mapping.get(key, ())
+        position = bisect.bisect_left(ids, value)
+        if position < len(ids) and ids[position] == value:
+            return
+        mapping[key] = ids[:position] + (value,) + ids[position:]
+
+    @staticmethod
+    def _delete(mapping, key, value):
+        ids = mapping.get(key, ())
+        position = bisect.bisect_left(ids, value)
+        if position == len(ids) or ids[position] != value:
+            return
+        ids = ids[:position] + ids[position + 1:]
+        if ids:
+            mapping[key] = ids
+        else:
+            del mapping[key]
+
+    def add(self, group_id, user_id):
+        self._insert(self._user_groups, user_id, group_id)
+        self._insert(self._group_users, group_id, user_id)
+
+    def remove(self, group_id, user_id):
+        self._delete(self._user_groups, user_id, group_id)
+        self._delete(self._group_users, group_id, user_id)
+
+    def groups_of(self, user_id):
+        """id групп ученика по возрастанию"""
+        return self._user_groups.get(user_id, ())
+
+    def users_of(self, group_id):
+        """id учеников группы по возрастанию"""
+        return self._group_users.get(group_id, ())
+
+    def is_member(self, group_id, user_id):
+        groups = self._user_groups.get(user_id, ())
+        position = bisect.bisect_left(groups, group_id)
+        return position < len(groups) and groups[position] == group_id
+
+    def __len__(self):
+        return sum(len(groups) for groups in self._user_groups.values())
+
+    def memory_usage(self):
+        """Приблизительный объём индекса в байтах (словари, кортежи и int)"""
+        total = 0
+        for mapping in (self._user_groups, self._group_users):
+            total += sys.getsizeof(mapping)
+            for key, ids in mapping.items():
+                total += sys.getsizeof(key) + sys.getsizeof(ids)
+                total += sum(sys.getsizeof(member) for member in ids)
+        return total
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метрики обработки обновлений
+
+Внешний middleware замеряет каждое обновление и относит его к функции-
+обработчику (show_my_groups, show_group_details, ...). Время внутри методов
+Database и запросов к Bot API копится отдельно, так что по гистограммам
+видно, куда уходит время обработчика: в базу, в Telegram или в остальной
+код (форматирование, клавиатуры). Запросы, отправленные через очередь
+OutboundSender, выполняются в её задачах и в API-время обновления не входят.
+
+Гистограммы и счётчики хранятся в памяти и отдаются в текстовом формате
+Prometheus на http://METRICS_HOST:METRICS_PORT/metrics:
+    curl -s http://127.0.0.1:9108/metrics | grep bot_update_duration
+"""
+
+import bisect
+import contextvars
+import inspect
+import logging
+import time
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм (сек)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Методы Database, которые не замеряются (запуск и остановка)
+SKIP_DB_METHODS = {"init", "close"}
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # Последняя ячейка — значения больше всех границ (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Trace:
+    """Время одного обновления по составляющим"""
+
+    __slots__ = ("handler", "db", "api")
+
+    def __init__(self):
+        self.handler = None
+        self.db = 0.0
+        self.api = 0.0
+
+
+# Обновление, которое сейчас обрабатывается в этой задаче
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+# Вложенность вызовов Database: в время обновления входят только внешние
+_db_depth = contextvars.ContextVar("metrics_db_depth", default=0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class Metrics:
+    """Реестр счётчиков, гистограмм и вычисляемых показателей
+
+    Метки передаются кортежем пар: (("handler", "show_my_groups"),).
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, labels=(), value=1):
+        series = self._counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, value, labels=()):
+        series = self._histograms.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, text, callback):
+        """Показатель, вычисляемый при каждом запросе /metrics
+
+        callback возвращает число или словарь {метки: число}.
+        """
+        self._gauges[name] = callback
+        self._help[name] = text
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name, series in sorted(self._counters.items()):
+            header(name, "counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        for name, series in sorted(self._histograms.items()):
+            header(name, "histogram")
+            for labels, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+        for name, callback in sorted(self._gauges.items()):
+            try:
+                values = callback()
+            except Exception:
+                logger.exception(f"Ошибка вычисления метрики {name}")
+                continue
+            header(name, "gauge")
+            if not isinstance(values, dict):
+                values = {(): values}
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: длительность, ошибки и состояние FSM"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        metrics.describe("bot_updates_total", "Обработанные обновления по обработчикам")
+        metrics.describe("bot_update_errors_total", "Обновления, обработка которых завершилась исключением")
+        metrics.describe("bot_updates_by_state_total", "Обновления по состоянию FSM пользователя")
+        metrics.describe("bot_update_duration_seconds", "Полное время обработки обновления")
+        metrics.describe("bot_update_db_seconds", "Время обновления внутри методов Database")
+        metrics.describe("bot_update_api_seconds", "Время обновления в запросах к Bot API")
+
+    async def __call__(self, handler, event, data):
+        trace = _Trace()
+        token = _trace.set(trace)
+        state = data.get("raw_state") or "none"
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _trace.reset(token)
+            name = trace.handler or "unhandled"
+            labels = (("handler", name),)
+            self.metrics.inc("bot_updates_total", labels)
+            self.metrics.inc("bot_updates_by_state_total", (("state", state),))
+            if failed:
+                self.metrics.inc("bot_update_errors_total", labels)
+            self.metrics.observe("bot_update_duration_seconds", elapsed, labels)
+            self.metrics.observe("bot_update_db_seconds", trace.db, labels)
+            self.metrics.observe("bot_update_api_seconds", trace.api, labels)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware: запоминает, какой обработчик выбран для обновления"""
+
+    async def __call__(self, handler, event, data):
+        trace = _trace.get()
+        handler_object = data.get("handler")
+        if trace is not None and handler_object is not None:
+            trace.handler = getattr(handler_object.callback, "__name__", "handler")
+        return await handler(event, data)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки запросов к Bot API"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        metrics.describe("bot_api_request_seconds", "Время запросов к Bot API по методам")
+        metrics.describe("bot_api_errors_total", "Запросы к Bot API, завершившиеся ошибкой")
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        labels = (("method", type(method).__name__),)
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            self.metrics.inc("bot_api_errors_total", labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe("bot_api_request_seconds", elapsed, labels)
+            trace = _trace.get()
+            if trace is not None:
+                trace.api += elapsed
+
+
+def instrument_database(db, metrics):
+    """Замерять публичные асинхронные методы экземпляра Database"""
+    metrics.describe("bot_db_method_seconds", "Время методов Database")
+    for name, function in inspect.getmembers(type(db), inspect.iscoroutinefunction):
+        if name.startswith("_") or name in SKIP_DB_METHODS:
+            continue
+        setattr(db, name, _timed_method(metrics, name, getattr(db, name)))
+
+
+def _timed_method(metrics, name, method):
+    labels = (("method", name),)
+
+    async def timed(*args, **kwargs):
+        depth = _db_depth.get()
+        token = _db_depth.set(depth + 1)
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _db_depth.reset(token)
+            metrics.observe("bot_db_method_seconds", elapsed, labels)
+            trace = _trace.get()
+            if trace is not None and depth == 0:
+                trace.db += elapsed
+
+    timed.__name__ = name
+    timed.__doc__ = method.__doc__
+    return timed
+
+
+def setup_metrics(metrics, dp, bot, db):
+    """Подключить замеры к диспетчеру, сессии бота и базе"""
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    for router in dp.chain_tail:
+        for event_name, observer in router.observers.items():
+            if event_name not in ("update", "error"):
+                observer.middleware(HandlerNameMiddleware())
+    bot.session.middleware(ApiMetricsMiddleware(metrics))
+    instrument_database(db, metrics)
+    fsm_storage = dp.fsm.storage
+    if hasattr(fsm_storage, "state_counts"):
+        metrics.gauge(
+            "bot_fsm_active_states", "Незавершённые диалоги в кэше FSM по состояниям",
+            lambda: {(("state", state),): count for state, count in fsm_storage.state_counts().items()}
+        )
+
+
+async def start_metrics_server(metrics, host=METRICS_HOST, port=METRICS_PORT):
+    """Запустить HTTP-сервер с /metrics; возвращает AppRunner (None, если порт 0)"""
+    if not port:
+        return None
+
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
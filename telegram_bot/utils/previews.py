@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Превью фотографий сданных работ
+
+Фото работы уменьшается до PREVIEW_SIZE по большей стороне, а фото
+задания собираются в обзорные листы (сетка PREVIEW_SHEET_COLUMNS ×
+PREVIEW_SHEET_ROWS с номерами), чтобы преподаватель мог быстро листать
+работы с телефона. Декодирование и масштабирование выполняются в пуле
+процессов: это чистая нагрузка на CPU, которая в потоке держала бы GIL
+и тормозила обработку обновлений.
+
+Готовые картинки кэшируются на диске по хэшу файла работы:
+uploads/previews/ab/cd/<sha256>.jpg, листы — uploads/previews/sheets/.
+После первой отправки превью в Telegram запоминается его file_id, и при
+повторном пролистывании картинка не загружается заново.
+
+Нужен Pillow; без него превью отключены (PREVIEWS_AVAILABLE = False),
+остальной бот работает как обычно.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import multiprocessing
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageDraw, ImageOps
+except ImportError:
+    Image = None
+
+from config import (
+    PREVIEW_WORKERS, PREVIEW_SIZE, PREVIEW_QUALITY,
+    PREVIEW_SHEET_COLUMNS, PREVIEW_SHEET_ROWS, PREVIEW_SHEET_CELL
+)
+from utils.cache import TTLCache, MISSING
+from utils.storage import GC_GRACE, shard
+
+logger = logging.getLogger(__name__)
+
+PREVIEWS_AVAILABLE = Image is not None
+if PREVIEWS_AVAILABLE:
+    DecompressionBombError = Image.DecompressionBombError
+else:
+    class DecompressionBombError(Exception):
+        """Заглушка: без Pillow превью не строятся"""
+PHOTO_EXTENSIONS = {"jpg", "jpeg", "png"}
+
+
+class PreviewError(Exception):
+    """Превью не удалось построить (текст ошибки показывается преподавателю)"""
+
+
+def is_photo(submission):
+    """Работа сдана фотографией или файлом-изображением"""
+    if submission['file_type'] == "photo":
+        return True
+    return bool(submission['file_name']) and Path(submission['file_name']).suffix[1:].lower() in PHOTO_EXTENSIONS
+
+
+# Функции ниже выполняются в процессах пула: получают и возвращают только пути и числа
+
+def _open_scaled(source, max_side):
+    """Открыть изображение, уменьшенное до max_side по большей стороне, в RGB"""
+    with warnings.catch_warnings():
+        # Выше Image.MAX_IMAGE_PIXELS Pillow только предупреждает и декодирует
+        # картинку целиком; такой файл отклоняется так же, как вдвое больший
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+        try:
+            image = Image.open(source)
+        except Image.DecompressionBombWarning as e:
+            raise Image.DecompressionBombError(str(e)) from None
+    # JPEG декодируется сразу в уменьшенном масштабе — в разы быстрее полного
+    image.draft("RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side))
+    return image.convert("RGB")
+
+
+def _save_jpeg(image, target, quality):
+    """Сохранить атомарно: читатели не увидят недописанный файл"""
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f"{target.name}.{os.getpid()}.part")
+    image.save(tmp_path, "JPEG", quality=quality, optimize=True)
+    os.replace(tmp_path, target)
+
+
+def _ready():
+    """Пустая задача: заставляет пул запустить процесс"""
+    return os.getpid()
+
+
+def render_preview(source, max_side, quality, target):
+    """Уменьшенная копия фото"""
+    image = _open_scaled(source, max_side)
+    _save_jpeg(image, target, quality)
+    return image.size
+
+
+def render_contact_sheet(cells, columns, cell, quality, target):
+    """Обзорный лист: cells — список (номер, путь превью или None)"""
+    rows = math.ceil(len(cells) / columns)
+    sheet = Image.new("RGB", (columns * cell, rows * cell), "white")
+    draw = ImageDraw.Draw(sheet)
+    padding = max(2, cell // 40)
+    for position, (number, source) in enumerate(cells):
+        left = (position % columns) * cell
+        top = (position // columns) * cell
+        if source is None:
+            draw.rectangle((left + padding, top + padding, left + cell - padding, top + cell - padding), fill="#dddddd")
+        else:
+            image = _open_scaled(source, cell - 2 * padding)
+            sheet.paste(image, (left + (cell - image.width) // 2, top + (cell - image.height) // 2))
+        label = str(number)
+        box = draw.textbbox((0, 0), label)
+        draw.rectangle((left + padding, top + padding, left + padding + box[2] + 8, top + padding + box[3] + 6), fill="black")
+        draw.text((left + padding + 4, top + padding + 3), label, fill="white")
+    _save_jpeg(sheet, target, quality)
+    return sheet.size
+
+
+class PreviewService:
+    """Превью и обзорные листы фото работ с кэшем на диске"""
+
+    def __init__(self, db, storage, workers=PREVIEW_WORKERS, size=PREVIEW_SIZE, quality=PREVIEW_QUALITY,
+                 columns=PREVIEW_SHEET_COLUMNS, rows=PREVIEW_SHEET_ROWS, cell=PREVIEW_SHEET_CELL):
+        self.db = db
+        self.storage = storage
+        self.available = PREVIEWS_AVAILABLE
+        self.workers = workers
+        self.size = size
+        self.quality = quality
+        self.columns = columns
+        self.sheet_size = columns * rows
+        self.cell = cell
+        self.root = storage.root / "previews"
+        self.sheets_dir = self.root / "sheets"
+        self._executor = None
+        # Незавершённые задачи пула по пути результата: одинаковые запросы ждут одну задачу
+        self._pending = {}
+        # Фоновая подготовка превью не занимает больше workers процессов одновременно
+        self._warmup_slots = asyncio.Semaphore(workers)
+        self._warmups = {}
+        # Имя файла превью -> file_id, под которым Telegram уже хранит эту картинку
+        self._file_ids = TTLCache(maxsize=10000, ttl=24 * 3600)
+
+    def _pool(self):
+        if self._executor is None:
+            # forkserver: потоки бота (aiosqlite, запись в БД) не копируются в процессы пула
+            context = multiprocessing.get_context("forkserver")
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._executor
+
+    def start(self):
+        """Запустить процессы пула заранее
+
+        Процесс пула при старте импортирует главный модуль бота (без создания
+        бота и сервисов — их создаёт main()) и Pillow. Вызывается при запуске
+        бота, чтобы первое превью не ждало.
+        """
+        if not self.available:
+            logger.info("Pillow не установлен: превью фото работ отключены")
+            return
+        pool = self._pool()
+        for _ in range(self.workers):
+            pool.submit(_ready)
+
+    def preview_path(self, file_hash):
+        return self.root / f"{shard(file_hash)}.jpg"
+
+    async def _render(self, target, function, *args):
+        """Построить target функцией в пуле процессов, если его ещё нет в кэше"""
+        if target.exists():
+            return target
+        future = self._pending.get(target)
+        if future is None:
+            if not self.available:
+                raise PreviewError("Для превью нужен Pillow")
+            future = asyncio.get_running_loop().run_in_executor(self._pool(), function, *args, str(target))
+            self._pending[target] = future
+            future.add_done_callback(lambda _: self._pending.pop(target, None))
+        try:
+            # shield: отмена одного ожидающего не отменяет задачу для остальных
+            await asyncio.shield(future)
+        except DecompressionBombError as e:
+            # Картинка с огромным числом пикселей: Pillow отказывается её декодировать
+            logger.warning(f"Превью {target.name} не построено: {e}")
+            raise PreviewError("Изображение слишком большое") from e
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось построить {target.name}: {e}")
+            raise PreviewError("Не удалось открыть изображение") from e
+        return target
+
+    async def photo_submissions(self, homework_id):
+        """Работы-фотографии по заданию в порядке сдачи (новые добавляются в конец)"""
+        submissions = await self.db.get_homework_submissions(homework_id)
+        return sorted((submission for submission in submissions if is_photo(submission)),
+                      key=lambda submission: submission['id'])
+
+    async def preview(self, bot, submission):
+        """Путь превью фото работы"""
+        path = await self.storage.materialize(bot, submission)
+        if path is None:
+            raise PreviewError("У работы нет файла")
+        # Имя файла в кэше хранилища — SHA-256 содержимого
+        target = self.preview_path(path.name)
+        return await self._render(target, render_preview, str(path), self.size, self.quality)
+
+    async def contact_sheet(self, bot, homework_id, page):
+        """Обзорный лист страницы page
+
+        Возвращает словарь: path, items (работы на листе), start (номер первой
+        с нуля), count (всего фото), page, pages; None, если фото-работ нет.
+        """
+        photos = await self.photo_submissions(homework_id)
+        if not photos:
+            return None
+        pages = math.ceil(len(photos) / self.sheet_size)
+        page = min(max(page, 0), pages - 1)
+        start = page * self.sheet_size
+        items = photos[start:start + self.sheet_size]
+
+        previews = await asyncio.gather(*(self.preview(bot, item) for item in items), return_exceptions=True)
+        for result in previews:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        cells = [
+            (start + number + 1, None if isinstance(result, Exception) else str(result))
+            for number, result in enumerate(previews)
+        ]
+        # Лист определяется набором превью: новая работа на странице даёт новый лист
+        key = hashlib.sha256(repr((cells, self.columns, self.cell)).encode()).hexdigest()
+        target = self.sheets_dir / f"{key}.jpg"
+        await self._render(target, render_contact_sheet, cells, self.columns, self.cell, self.quality)
+        return {"path": target, "items": items, "start": start, "count": len(photos), "page": page, "pages": pages}
+
+    def warm_up(self, bot, homework_id):
+        """Подготовить превью всех фото задания в фоне, пока преподаватель смотрит первые"""
+        if not self.available or homework_id in self._warmups:
+            return
+        task = asyncio.create_task(self._warm_up(bot, homework_id))
+        self._warmups[homework_id] = task
+        task.add_done_callback(lambda _: self._warmups.pop(homework_id, None))
+
+    async def _warm_up(self, bot, homework_id):
+        started = time.monotonic()
+        photos = await self.photo_submissions(homework_id)
+
+        async def prepare(submission):
+            async with self._warmup_slots:
+                try:
+                    await self.preview(bot, submission)
+                except Exception as e:
+                    logger.warning(f"Превью работы {submission['id']} не подготовлено: {e}")
+
+        await asyncio.gather(*(prepare(submission) for submission in photos))
+        logger.info(f"Превью задания {homework_id} готовы: {len(photos)} фото за {time.monotonic() - started:.1f} с")
+
+    def file_id(self, path):
+        """file_id уже отправленной в Telegram картинки (или None)"""
+        file_id = self._file_ids.get(path.name)
+        return None if file_id is MISSING else file_id
+
+    def remember_file_id(self, path, message):
+        """Запомнить file_id картинки из ответа Telegram на отправку"""
+        if message is not None and getattr(message, "photo", None):
+            self._file_ids.set(path.name, message.photo[-1].file_id)
+
+    def remove_stale(self, referenced, grace=GC_GRACE):
+        """Удалить превью файлов, на которые не ссылаются работы, и старые листы
+
+        Возвращает (файлов, байт).
+        """
+        removed = freed = 0
+        cutoff = time.time() - grace
+        candidates = [path for path in self.root.glob("*/*/*.jpg") if path.stem not in referenced]
+        candidates.extend(self.sheets_dir.glob("*.jpg"))
+        for path in candidates:
+            stat = path.stat()
+            if stat.st_mtime > cutoff:
+                continue
+            path.unlink()
+            removed += 1
+            freed += stat.st_size
+        return removed, freed
+
+    async def close(self):
+        """Остановить фоновую подготовку и пул процессов"""
+        tasks = list(self._warmups.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, wait=True, cancel_futures=True)
+            self._executor = None
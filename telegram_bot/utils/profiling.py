@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Профилирование работающего бота по командам преподавателя
+
+/profile N — профиль CPU: отдельный поток N секунд каждые PROFILE_INTERVAL
+снимает стеки всех потоков процесса (sys._current_frames) и считает, в
+каких функциях они находились. Бот в это время работает как обычно,
+поэтому профиль показывает реальную нагрузку. В отчёте — доля времени,
+когда каждый поток был занят, функции по собственному и полному времени
+и свёрнутые стеки для flamegraph.pl или speedscope.
+
+/memprofile N — разница двух снимков tracemalloc с интервалом N секунд:
+какие строки кода за это время выделили и удерживают память. Если
+tracemalloc не был включён, он включается только на время замера.
+Снимок делается под GIL, поэтому в начале и в конце замера бот
+ненадолго перестаёт отвечать; преподаватель предупреждается об этом.
+
+Отчёт отправляется текстовым документом; одновременно идёт не больше
+одного профиля каждого вида.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from aiogram.methods import SendDocument, SendMessage
+from aiogram.types import BufferedInputFile
+
+from config import PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS, PROFILE_INTERVAL, PROFILE_TRACEMALLOC_FRAMES
+from utils.sender import PRIORITY_INTERACTIVE
+from utils.sources import short_path
+
+logger = logging.getLogger(__name__)
+
+# Строк в таблицах отчёта
+REPORT_LIMIT = 40
+# Функции, в которых поток ждёт работы (select цикла событий, очереди, блокировки)
+IDLE_FUNCTIONS = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def parse_seconds(args, default=PROFILE_DEFAULT_SECONDS, maximum=PROFILE_MAX_SECONDS):
+    """Длительность из аргумента команды; None, если аргумент не число"""
+    if not args:
+        return default
+    try:
+        seconds = int(args.strip())
+    except ValueError:
+        return None
+    return min(max(seconds, 1), maximum)
+
+
+def _label(function):
+    filename, lineno, name = function
+    return f"{name} ({short_path(filename)}:{lineno})"
+
+
+# CPU
+
+def sample_stacks(seconds, interval, stop, loop_thread=None):
+    """Снимать стеки всех потоков seconds секунд или до stop.set() (в отдельном потоке)
+
+    Возвращает (число выборок, Counter {(имя потока, стек): выборок}); стек —
+    кортеж функций (файл, первая строка, имя) от внешней к внутренней.
+    """
+    own = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and not stop.is_set():
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        if loop_thread is not None:
+            names[loop_thread] = "event-loop"
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            stack.reverse()
+            stacks[(names.get(ident, str(ident)), tuple(stack))] += 1
+        samples += 1
+        stop.wait(interval)
+    return samples, stacks
+
+
+def _is_idle(stack):
+    if not stack:
+        return True
+    filename, _, name = stack[-1]
+    return (Path(filename).name, name) in IDLE_FUNCTIONS
+
+
+def format_cpu_report(samples, stacks, seconds, interval):
+    """Текст отчёта профиля CPU"""
+    threads = Counter()
+    busy = Counter()
+    own_time = Counter()
+    total_time = Counter()
+    for (thread, stack), count in stacks.items():
+        threads[thread] += count
+        if _is_idle(stack):
+            continue
+        busy[thread] += count
+        own_time[stack[-1]] += count
+        for function in set(stack):
+            total_time[function] += count
+
+    busy_samples = sum(busy.values())
+    lines = [
+        f"Профиль CPU: {seconds} с, выборка каждые {interval * 1000:g} мс, выборок {samples}",
+        f"Снят {datetime.now():%Y-%m-%d %H:%M:%S}",
+        "",
+        "Потоки (доля выборок, когда поток был занят, а не ждал работы):",
+    ]
+    for thread, count in threads.most_common():
+        share = busy[thread] / count * 100 if count else 0
+        lines.append(f"  {thread}: занят {share:.1f}% ({busy[thread]} из {count})")
+
+    def table(title, counter):
+        lines.extend(["", title, "  выборок      %  функция"])
+        for function, count in counter.most_common(REPORT_LIMIT):
+            share = count / busy_samples * 100 if busy_samples else 0
+            lines.append(f"  {count:7d} {share:6.1f}  {_label(function)}")
+
+    table("Функции по собственному времени (занятые выборки всех потоков):", own_time)
+    table("Функции по полному времени (с вложенными вызовами):", total_time)
+
+    lines.extend(["", "Свёрнутые стеки занятых выборок (flamegraph.pl, speedscope):"])
+    collapsed = Counter()
+    for (thread, stack), count in stacks.items():
+        if not _is_idle(stack):
+            collapsed[";".join([thread, *(_label(function) for function in stack)])] += count
+    for stack, count in sorted(collapsed.items()):
+        lines.append(f"{stack} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# Память
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _size(size):
+    sign = "-" if size < 0 else "+"
+    size = abs(size)
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{sign}{size:.0f} {unit}" if unit == "Б" else f"{sign}{size:.1f} {unit}"
+        size /= 1024
+    return f"{sign}{size:.1f} ГБ"
+
+
+def format_memory_report(first, second, seconds, traced, started_here):
+    """Текст отчёта по разнице снимков tracemalloc"""
+    first = first.filter_traces(SNAPSHOT_FILTERS)
+    second = second.filter_traces(SNAPSHOT_FILTERS)
+    current, peak = traced
+    by_line = second.compare_to(first, "lineno")
+    growth = sum(stat.size_diff for stat in by_line)
+    lines = [
+        f"Снимки памяти tracemalloc с интервалом {seconds} с",
+        f"Снят {datetime.now():%Y-%m-%d %H:%M:%S}",
+        f"Отслеживается сейчас: {current / 1024 / 1024:.1f} МБ, пик {peak / 1024 / 1024:.1f} МБ",
+        f"Изменение за интервал: {_size(growth)}",
+    ]
+    if started_here:
+        lines.append("tracemalloc включён на время замера: учтена только память, выделенная за интервал")
+
+    lines.extend(["", f"Строки по изменению памяти (первые {REPORT_LIMIT}):"])
+    for stat in by_line[:REPORT_LIMIT]:
+        frame = stat.traceback[0]
+        lines.append(
+            f"  {_size(stat.size_diff):>11}  {stat.count_diff:+7d} блоков  "
+            f"{short_path(frame.filename)}:{frame.lineno}"
+        )
+
+    lines.extend(["", "Стеки с наибольшим ростом:"])
+    for stat in second.compare_to(first, "traceback")[:10]:
+        if stat.size_diff <= 0:
+            break
+        lines.append(f"{_size(stat.size_diff)}, {stat.count_diff:+d} блоков:")
+        lines.extend(f"  {line}" for line in stat.traceback.format(most_recent_first=True))
+    return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """Профили CPU и памяти в фоне с отправкой отчёта документом"""
+
+    def __init__(self, sender, interval=PROFILE_INTERVAL, frames=PROFILE_TRACEMALLOC_FRAMES):
+        self.sender = sender
+        self.interval = interval
+        self.frames = frames
+        # Вид профиля -> задача
+        self._tasks = {}
+        # Останавливает поток выборки профиля CPU при выключении бота
+        self._stop = threading.Event()
+
+    def running(self, kind):
+        return kind in self._tasks
+
+    def start_cpu(self, chat_id, seconds):
+        """Запустить профиль CPU; False, если он уже идёт"""
+        # Вызывается из обработчика — текущий поток и есть поток цикла событий
+        return self._start("cpu", chat_id, self._cpu(seconds, threading.get_ident()))
+
+    def start_memory(self, chat_id, seconds):
+        """Запустить снимки памяти; False, если они уже идут"""
+        return self._start("memory", chat_id, self._memory(seconds))
+
+    def _start(self, kind, chat_id, coroutine):
+        if kind in self._tasks:
+            coroutine.close()
+            return False
+        task = asyncio.create_task(self._run(kind, chat_id, coroutine))
+        self._tasks[kind] = task
+        task.add_done_callback(lambda _: self._tasks.pop(kind, None))
+        return True
+
+    async def _cpu(self, seconds, loop_thread):
+        samples, stacks = await asyncio.to_thread(sample_stacks, seconds, self.interval, self._stop, loop_thread)
+        return await asyncio.to_thread(format_cpu_report, samples, stacks, seconds, self.interval)
+
+    async def _memory(self, seconds):
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(self.frames)
+        try:
+            # take_snapshot — один вызов C, который обходит все отслеживаемые блоки,
+            # не отпуская GIL: бот на это время останавливается, и поток бы не помог
+            first = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            second = tracemalloc.take_snapshot()
+            traced = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+        return await asyncio.to_thread(format_memory_report, first, second, seconds, traced, started_here)
+
+    async def _run(self, kind, chat_id, coroutine):
+        started = datetime.now()
+        try:
+            report = await coroutine
+            filename = f"{kind}-profile-{started:%Y%m%d-%H%M%S}.txt"
+            caption = "🔥 Профиль CPU" if kind == "cpu" else "🧠 Снимки памяти"
+            await self.sender.call(
+                SendDocument(chat_id=chat_id, document=BufferedInputFile(report.encode("utf-8"), filename),
+                             caption=caption),
+                chat_id, PRIORITY_INTERACTIVE
+            )
+            logger.info(f"Отчёт профилирования {filename} отправлен")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Ошибка профилирования ({kind})")
+            try:
+                await self.sender.call(
+                    SendMessage(chat_id=chat_id, text="❌ Не удалось снять профиль, подробности в логе"),
+                    chat_id, PRIORITY_INTERACTIVE
+                )
+            except Exception:
+                logger.exception(f"Не удалось сообщить об ошибке профилирования ({kind}) в чат {chat_id}")
+
+    async def close(self):
+        """Прервать незавершённые профили"""
+        self._stop.set()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Вычисление дат занятий и сроков с учётом часового пояса (config.TIMEZONE)
+"""
+
+from datetime import datetime, date, time as dtime, timedelta
+
+import pytz
+
+from config import TIMEZONE
+
+TZ = pytz.timezone(TIMEZONE)
+
+# Форматы, в которых преподаватель вводит срок сдачи
+DUE_DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d", "%d.%m.%y")
+
+
+def now():
+    """Текущее время в часовом поясе бота"""
+    return datetime.now(TZ)
+
+
+def localize(day, hour, minute):
+    """Локальное время в часовом поясе бота (с учётом перехода на летнее время)"""
+    return TZ.localize(datetime.combine(day, dtime(hour, minute)))
+
+
+def parse_time(time_str):
+    """'HH:MM' -> (часы, минуты)"""
+    hour, minute = time_str.split(":")
+    return int(hour), int(minute)
+
+
+def next_weekly_occurrence(day_of_week, time_str, after):
+    """Ближайшее начало еженедельного занятия строго позже after
+
+    day_of_week — 1 (понедельник) … 7 (воскресенье), как в таблице schedule.
+    """
+    hour, minute = parse_time(time_str)
+    local_after = after.astimezone(TZ)
+    days_ahead = (day_of_week - 1 - local_after.weekday()) % 7
+    day = local_after.date() + timedelta(days=days_ahead)
+    occurrence = localize(day, hour, minute)
+    if occurrence <= after:
+        occurrence = localize(day + timedelta(days=7), hour, minute)
+    return occurrence
+
+
+def week_start(weeks_ahead=0, today=None):
+    """Дата понедельника текущей (или через weeks_ahead) недели в часовом поясе бота"""
+    today = today or now().date()
+    return today - timedelta(days=today.weekday()) + timedelta(weeks=weeks_ahead)
+
+
+def expand_week(entries, monday):
+    """Развернуть еженедельные записи расписания в занятия конкретной недели
+
+    Возвращает список словарей записи с добавленными start / end
+    (aware datetime), отсортированный по началу занятия.
+    """
+    occurrences = []
+    for entry in entries:
+        try:
+            hour, minute = parse_time(entry['time'])
+        except (ValueError, AttributeError):
+            continue
+        start = localize(monday + timedelta(days=entry['day_of_week'] - 1), hour, minute)
+        occurrence = dict(entry)
+        occurrence['start'] = start
+        occurrence['end'] = start + timedelta(minutes=entry['duration'] or 0)
+        occurrences.append(occurrence)
+    occurrences.sort(key=lambda item: item['start'])
+    return occurrences
+
+
+def parse_due_date(due_date):
+    """Разобрать срок сдачи задания; None, если формат не распознан"""
+    if not due_date:
+        return None
+    if isinstance(due_date, date):
+        return due_date
+    for fmt in DUE_DATE_FORMATS:
+        try:
+            return datetime.strptime(due_date.strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш готовых экранов ученика
+
+Экраны «📅 Расписание» и «📝 Домашние задания» (текст и клавиатура)
+строятся один раз и хранятся по user_id. Запись ученика сбрасывается
+только при изменениях, которые его касаются: вступление в группу, новое
+занятие или задание для него или его группы, сдача работы и оценка.
+"""
+
+import logging
+
+from config import SCREEN_CACHE_SIZE, SCREEN_CACHE_TTL
+from utils.cache import TTLCache, MISSING
+from utils.helpers import format_homework_list, format_schedule
+from utils.keyboards import get_homework_keyboard, get_schedule_keyboard
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE = "schedule"
+HOMEWORK = "homework"
+
+
+class ScreenCache:
+    """Отрисованные экраны по user_id: {(вид, параметры): (текст, клавиатура)}"""
+
+    def __init__(self, db, maxsize=SCREEN_CACHE_SIZE, ttl=SCREEN_CACHE_TTL):
+        self.db = db
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._epoch = 0
+
+    async def _get(self, user_id, key, render):
+        screens = self.cache.get(user_id)
+        if screens is not MISSING and key in screens:
+            return screens[key]
+
+        epoch = self._epoch
+        result = await render()
+        # Если данные поменялись во время запроса, результат не сохраняем
+        if epoch == self._epoch:
+            screens = self.cache.get(user_id)
+            if screens is MISSING:
+                screens = {}
+                self.cache.set(user_id, screens)
+            screens[key] = result
+        return result
+
+    async def schedule(self, user_id):
+        """Текст и клавиатура экрана расписания"""
+        async def render():
+            entries = await self.db.get_user_schedule(user_id)
+            return format_schedule(entries), get_schedule_keyboard()
+
+        return await self._get(user_id, (SCHEDULE,), render)
+
+    async def homework(self, user_id, after_id=None, before_id=None):
+        """Текст и клавиатура страницы домашних заданий"""
+        async def render():
+            page = await self.db.get_user_homework_page(user_id, after_id=after_id, before_id=before_id)
+            keyboard = get_homework_keyboard(page['items'], prev_id=page['prev_id'], next_id=page['next_id'])
+            return format_homework_list(page['items']), keyboard
+
+        return await self._get(user_id, (HOMEWORK, after_id, before_id), render)
+
+    def invalidate_user(self, user_id, kind=None):
+        """Сбросить экраны ученика (все или только одного вида)"""
+        self._epoch += 1
+        if kind is None:
+            self.cache.invalidate(user_id)
+            return
+        screens = self.cache.get(user_id)
+        if screens is not MISSING:
+            for key in [key for key in screens if key[0] == kind]:
+                del screens[key]
+
+    def _invalidate_target(self, user_id, group_id, kind):
+        """Сбросить экраны адресата записи: ученика или всех участников группы"""
+        if user_id:
+            self.invalidate_user(user_id, kind)
+        if group_id:
+            for member_id in self.db.members.users_of(group_id):
+                self.invalidate_user(member_id, kind)
+
+    def on_group_member_added(self, group_id, user_id):
+        """Обработчик события Database: ученик добавлен в группу"""
+        self.invalidate_user(user_id)
+
+    def on_schedule_created(self, entry_id, user_id, group_id, **_):
+        """Обработчик события Database: новая запись расписания"""
+        self._invalidate_target(user_id, group_id, SCHEDULE)
+
+    def on_homework_created(self, homework_id, user_id, group_id, **_):
+        """Обработчик события Database: новое задание"""
+        self._invalidate_target(user_id, group_id, HOMEWORK)
+
+    def on_submission_changed(self, homework_id, user_id, **_):
+        """Обработчик события Database: работа сдана или оценена"""
+        self.invalidate_user(user_id, HOMEWORK)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Исходящая очередь сообщений с учётом лимитов Telegram
+
+Все массовые отправки (сообщения группе, объявления о заданиях,
+напоминания) идут через OutboundSender: он держит token bucket на весь
+бот, на каждый чат и (строже) на групповые чаты, пропускает интерактивные
+ответы вперёд массовых рассылок и повторяет запрос после 429 с учётом
+retry_after.
+
+Ответы обработчиков (message.answer, edit_text) уходят в Bot API напрямую;
+SenderRequestMiddleware сессии бота списывает их с общего ведра без
+ожидания: ответ не ждёт очереди рассылок, а рассылки притормаживают,
+пока ведро не восстановится. 429 одного чата останавливает только этот
+чат; весь бот ждёт, лишь когда 429 почти одновременно приходит из
+нескольких чатов (это глобальный лимит).
+"""
+
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+from aiogram.methods import SendMessage, EditMessageText
+
+from config import (
+    SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_GROUP_CHAT_RATE,
+    SEND_MAX_RETRIES, SEND_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Сколько задач каждой очереди просматривать в поисках готового чата
+SCAN_LIMIT = 200
+# Сколько последних задержек хранить для метрик
+WAIT_SAMPLES = 1000
+# При таком числе отслеживаемых чатов простаивающие ведра удаляются
+MAX_CHAT_BUCKETS = 10000
+
+# 429 из стольких разных чатов за GLOBAL_FLOOD_WINDOW секунд — глобальный лимит бота
+GLOBAL_FLOOD_CHATS = 3
+GLOBAL_FLOOD_WINDOW = 1.0
+
+# Запрос отправляется воркером очереди (токены уже взяты)
+_from_queue = contextvars.ContextVar("from_queue", default=False)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "blocked_until")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now):
+        """Через сколько секунд будет доступен токен"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def borrow(self, now):
+        """Взять токен без ожидания: долг (не больше capacity) ждут остальные отправки"""
+        self._refill(now)
+        self.tokens = max(self.tokens - 1, -self.capacity)
+
+    def block(self, seconds):
+        """Заблокировать отправку (после 429 retry_after)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class _Job:
+    __slots__ = ("method", "chat_id", "priority", "future", "enqueued_at", "attempts")
+
+    def __init__(self, method, chat_id, priority, future):
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class OutboundSender:
+    """Центральный диспетчер исходящих запросов к Bot API"""
+
+    def __init__(self, bot, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE,
+                 group_chat_rate=SEND_GROUP_CHAT_RATE, max_retries=SEND_MAX_RETRIES,
+                 concurrency=SEND_CONCURRENCY):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._lanes = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BULK: deque()}
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._worker = None
+        self._in_flight = set()
+        # Недавние 429: (время, chat_id)
+        self._floods = deque()
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self._waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in self._lanes}
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._prune_chats()
+            # Отрицательные id — групповые чаты, у них лимит около 20 сообщений в минуту;
+            # "@username" — публичные каналы и супергруппы, лимит у них тот же
+            if not isinstance(chat_id, int) or chat_id < 0:
+                bucket = TokenBucket(self.group_chat_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, SEND_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune_chats(self):
+        """Забыть чаты, чьи ведра полностью восстановились"""
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chats.items()):
+            if bucket.delay(now) <= 0 and bucket.tokens >= bucket.capacity:
+                del self._chats[chat_id]
+
+    async def call(self, method, chat_id, priority=PRIORITY_BULK):
+        """Поставить запрос Bot API в очередь и дождаться результата"""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append(_Job(method, chat_id, priority, future))
+        self._wakeup.set()
+        return await future
+
+    async def send_message(self, chat_id, text, priority=PRIORITY_BULK, **kwargs):
+        """Отправить сообщение через очередь"""
+        return await self.call(SendMessage(chat_id=chat_id, text=text, **kwargs), chat_id, priority)
+
+    async def edit_message_text(self, chat_id, message_id, text, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """Изменить текст сообщения через очередь"""
+        method = EditMessageText(chat_id=chat_id, message_id=message_id, text=text, **kwargs)
+        return await self.call(method, chat_id, priority)
+
+    async def acquire(self):
+        """Учесть в общем ведре интерактивный запрос в обход очереди
+
+        Ответ не ждёт восстановления ведра (его ждут массовые рассылки),
+        задерживается только глобальной паузой после 429.
+        """
+        wait = self._global.blocked_until - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._global.borrow(time.monotonic())
+
+    def flood_wait(self, chat_id, seconds):
+        """Учесть 429 retry_after: пауза для чата, а при глобальном лимите — для всего бота"""
+        now = time.monotonic()
+        self._chat_bucket(chat_id).block(seconds)
+        self._floods.append((now, chat_id))
+        while self._floods[0][0] < now - GLOBAL_FLOOD_WINDOW:
+            self._floods.popleft()
+        if len({flood_chat for _, flood_chat in self._floods}) >= GLOBAL_FLOOD_CHATS:
+            logger.warning(f"429 из {GLOBAL_FLOOD_CHATS} чатов подряд: все отправки приостановлены на {seconds} с")
+            self._global.block(seconds)
+        self._wakeup.set()
+
+    def _pick(self, now):
+        """Выбрать первую задачу, чей чат готов к отправке
+
+        Возвращает (задача, 0) или (None, сколько ждать до ближайшей готовой).
+        """
+        min_wait = None
+        for lane in self._lanes.values():
+            for index, job in enumerate(itertools.islice(lane, SCAN_LIMIT)):
+                wait = self._chat_bucket(job.chat_id).delay(now)
+                if wait <= 0:
+                    del lane[index]
+                    return job, 0
+                if min_wait is None or wait < min_wait:
+                    min_wait = wait
+        return None, min_wait
+
+    async def _run(self):
+        while True:
+            if not any(self._lanes.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            wait = self._global.delay(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            job, wait = self._pick(now)
+            if job is None:
+                # Ждём освобождения чата или новой задачи
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.consume(now)
+            self._chat_bucket(job.chat_id).consume(now)
+            await self._slots.acquire()
+            task = asyncio.create_task(self._execute(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, job):
+        _from_queue.set(True)
+        try:
+            if job.attempts == 0:
+                self._waits[job.priority].append(time.monotonic() - job.enqueued_at)
+            job.attempts += 1
+            result = await self.bot(job.method)
+        except TelegramRetryAfter as e:
+            self.retries += 1
+            self.flood_wait(job.chat_id, e.retry_after)
+            logger.warning(f"Flood limit для чата {job.chat_id}: повтор через {e.retry_after} с")
+            self._retry(job, e, front=True)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            self.retries += 1
+            self._chat_bucket(job.chat_id).block(min(2 ** job.attempts, 30))
+            self._retry(job, e)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _retry(self, job, error, front=False):
+        if job.attempts > self.max_retries:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(error)
+            return
+        lane = self._lanes[job.priority]
+        if front:
+            lane.appendleft(job)
+        else:
+            lane.append(job)
+        self._wakeup.set()
+
+    def stats(self):
+        """Метрики очереди: глубина, ожидание, счётчики"""
+        result = {"sent": self.sent, "failed": self.failed, "retries": self.retries,
+                  "in_flight": len(self._in_flight)}
+        for priority, name in ((PRIORITY_INTERACTIVE, "interactive"), (PRIORITY_BULK, "bulk")):
+            waits = sorted(self._waits[priority])
+            result[f"{name}_depth"] = len(self._lanes[priority])
+            result[f"{name}_wait_avg"] = sum(waits) / len(waits) if waits else 0.0
+            result[f"{name}_wait_p95"] = waits[int(len(waits) * 0.95)] if waits else 0.0
+            result[f"{name}_wait_max"] = waits[-1] if waits else 0.0
+        return result
+
+    async def close(self, timeout=10):
+        """Дождаться отправки очереди (не дольше timeout) и остановить воркер"""
+        deadline = time.monotonic() + timeout
+        while (any(self._lanes.values()) or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for lane in self._lanes.values():
+            while lane:
+                job = lane.popleft()
+                if not job.future.done():
+                    job.future.cancel()
+
+
+class SenderRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: прямые запросы в чаты тоже расходуют общее ведро
+
+    Ответы обработчиков идут мимо очереди и без ожидания списываются
+    с общего ведра; их 429 учитывается так же, как у очереди. Запросы без
+    chat_id (getUpdates, answerCallbackQuery) в лимит сообщений не входят.
+    """
+
+    def __init__(self, sender):
+        self.sender = sender
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or _from_queue.get():
+            return await make_request(bot, method)
+        await self.sender.acquire()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            self.sender.flood_wait(chat_id, e.retry_after)
+            logger.warning(f"Flood limit для чата {chat_id}: отправка в него приостановлена на {e.retry_after} с")
+            raise
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сторож цикла событий
+
+Задача в цикле событий каждые LOOP_LAG_INTERVAL секунд засыпает и
+замеряет, насколько позже срока проснулась: это задержка, с которой
+цикл успевает обрабатывать обновления. Отдельный поток следит за
+«пульсом» этой задачи; если цикл не отвечает дольше LOOP_LAG_THRESHOLD,
+поток снимает стек потока цикла — так видно, какой синхронный код его
+держит. Когда блокировка заканчивается, она пишется в лог с местом в
+коде, а места копятся в рейтинге, который преподаватель видит по /lag.
+"""
+
+import asyncio
+import html
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+from utils.sources import is_project_file, short_path
+
+logger = logging.getLogger(__name__)
+
+THIS_FILE = Path(__file__).resolve()
+# Замеров задержки в окне для процентилей
+LAG_WINDOW = 600
+# Кадров стека в отчёте
+STACK_DEPTH = 8
+
+
+def _location(stack):
+    """Место блокировки: самый глубокий кадр кода бота (не библиотек)"""
+    for frame in reversed(stack):
+        path = Path(frame.filename)
+        if path != THIS_FILE and is_project_file(path):
+            return f"{short_path(path)}:{frame.lineno} {frame.name}"
+    frame = stack[-1]
+    return f"{short_path(frame.filename)}:{frame.lineno} {frame.name}"
+
+
+class LoopWatchdog:
+    """Замер задержки цикла событий и выборка стеков при блокировках"""
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, threshold=LOOP_LAG_THRESHOLD, metrics=None):
+        self.interval = interval
+        self.threshold = threshold
+        self.metrics = metrics
+        # Поток проверяет пульс чаще порога, чтобы успеть застать блокировку
+        self.sample_interval = min(0.02, threshold / 4)
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread = None
+        self._lock = threading.Lock()
+        # Стеки, снятые во время текущей блокировки
+        self._samples = []
+        # Место -> [блокировок, суммарно сек, максимум сек, стек]
+        self._offenders = {}
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        if metrics is not None:
+            metrics.describe("bot_loop_lag_seconds", "Задержка цикла событий")
+            metrics.describe("bot_loop_stalls_total", "Блокировки цикла событий дольше порога")
+
+    def start(self):
+        """Запустить замер (вызывается из работающего цикла событий)"""
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Сторож цикла событий запущен (порог {self.threshold * 1000:.0f} мс)")
+
+    async def _measure(self):
+        while True:
+            started = time.monotonic()
+            self._heartbeat = started
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - started - self.interval)
+            self.lags.append(lag)
+            if self.metrics is not None:
+                self.metrics.observe("bot_loop_lag_seconds", lag)
+            if lag >= self.threshold:
+                self._stall_finished(lag)
+
+    def _sample(self):
+        """Поток-наблюдатель: снимает стек цикла, пока тот не отвечает"""
+        while not self._stop.wait(self.sample_interval):
+            blocked = time.monotonic() - self._heartbeat - self.interval
+            if blocked < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            del frame
+            with self._lock:
+                self._samples.append(stack)
+
+    def _stall_finished(self, lag):
+        with self._lock:
+            samples, self._samples = self._samples, []
+        self.stalls += 1
+        if self.metrics is not None:
+            self.metrics.inc("bot_loop_stalls_total")
+
+        if samples:
+            # Место, где цикл провёл больше всего выборок
+            counts = {}
+            for stack in samples:
+                location = _location(stack)
+                counts[location] = counts.get(location, 0) + 1
+            location = max(counts, key=counts.get)
+            stack = next(stack for stack in samples if _location(stack) == location)
+            stack_text = "".join(traceback.format_list(stack[-STACK_DEPTH:]))
+        else:
+            # Блокировка закончилась раньше, чем поток успел её застать
+            location = "короче периода выборки"
+            stack_text = ""
+
+        with self._lock:
+            entry = self._offenders.get(location)
+            if entry is None:
+                entry = self._offenders[location] = [0, 0.0, 0.0, stack_text]
+            entry[0] += 1
+            entry[1] += lag
+            if lag > entry[2]:
+                entry[2] = lag
+                entry[3] = stack_text or entry[3]
+        logger.warning(f"Цикл событий заблокирован на {lag * 1000:.0f} мс: {location}\n{stack_text}".rstrip())
+
+    def offenders(self, limit=5):
+        """Места блокировок по суммарному времени: [(место, раз, всего сек, максимум сек, стек)]"""
+        with self._lock:
+            items = [(location, *entry) for location, entry in self._offenders.items()]
+        items.sort(key=lambda item: item[2], reverse=True)
+        return items[:limit]
+
+    def lag_percentiles(self):
+        """(p50, p99, максимум) задержки по последним замерам, сек"""
+        lags = sorted(self.lags)
+        if not lags:
+            return 0.0, 0.0, 0.0
+        return lags[len(lags) // 2], lags[min(len(lags) - 1, int(len(lags) * 0.99))], lags[-1]
+
+    def report(self, limit=5):
+        """Текст отчёта для преподавателя (HTML)"""
+        p50, p99, worst = self.lag_percentiles()
+        text = "⏱ <b>Задержка цикла событий</b>\n\n"
+        text += f"Последние {len(self.lags)} замеров: p50 {p50 * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс, "
+        text += f"максимум {worst * 1000:.1f} мс\n"
+        text += f"Блокировок дольше {self.threshold * 1000:.0f} мс: <b>{self.stalls}</b>\n"
+        offenders = self.offenders(limit)
+        if not offenders:
+            return text + "\n✅ Блокировок не было"
+        text += "\n<b>Главные источники:</b>\n"
+        for number, (location, count, total, longest, _) in enumerate(offenders, 1):
+            text += (
+                f"{number}. <code>{html.escape(location)}</code> — {count} раз, "
+                f"всего {total * 1000:.0f} мс, максимум {longest * 1000:.0f} мс\n"
+            )
+        return text
+
+    async def close(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
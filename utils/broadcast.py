@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Рассылка объявлений о новых домашних заданиях
+
+Записи homework_deliveries для всех получателей создаются в той же
+транзакции, что и задание (Database.create_homework). По событию
+homework_created фоновая задача рассылает уведомления через
+OutboundSender с ограниченным параллелизмом. Статус каждого получателя
+сохраняется, поэтому после падения бота — даже сразу после создания
+задания — рассылка продолжается с тех, кому сообщение ещё не доставлено.
+"""
+
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import BROADCAST_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Сколько получателей загружать из базы за раз
+RECIPIENTS_CHUNK = 1000
+
+
+def format_homework_announcement(homework):
+    """Текст уведомления о новом задании"""
+    text = "📚 <b>Новое домашнее задание!</b>\n\n"
+    text += f"📝 <b>{homework['title']}</b>\n"
+    if homework.get('description'):
+        text += f"{homework['description']}\n"
+    text += f"\n📅 Срок: {homework['due_date'] or 'Не указан'}"
+    return text
+
+
+def get_announcement_keyboard():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📝 Открыть задания", callback_data="my_homework")]
+    ])
+
+
+class Broadcaster:
+    """Фоновая рассылка объявлений о заданиях"""
+
+    def __init__(self, db, sender, concurrency=BROADCAST_CONCURRENCY):
+        self.db = db
+        self.sender = sender
+        self.concurrency = concurrency
+        self._tasks = {}
+
+    def on_homework_created(self, homework_id, **_):
+        """Обработчик события Database: запустить рассылку, не блокируя хендлер"""
+        self.start(homework_id)
+
+    def start(self, homework_id):
+        """Запустить рассылку по заданию (если она ещё не идёт)"""
+        if homework_id in self._tasks:
+            return self._tasks[homework_id]
+        task = asyncio.create_task(self._run(homework_id))
+        self._tasks[homework_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(homework_id, None))
+        return task
+
+    async def resume(self):
+        """Продолжить рассылки, прерванные перезапуском"""
+        for homework_id in await self.db.get_homework_with_pending_deliveries():
+            logger.info(f"Возобновляется рассылка по заданию {homework_id}")
+            self.start(homework_id)
+
+    async def _run(self, homework_id):
+        try:
+            homework = await self.db.get_homework_details(homework_id)
+            if homework is None:
+                logger.warning(f"Задание {homework_id} не найдено, рассылка отменена")
+                return
+            text = format_homework_announcement(homework)
+            keyboard = get_announcement_keyboard()
+            slots = asyncio.Semaphore(self.concurrency)
+
+            async def deliver(user_id):
+                async with slots:
+                    await self._deliver(homework_id, user_id, text, keyboard)
+
+            last_user_id = 0
+            while True:
+                recipients = await self.db.get_pending_deliveries(
+                    homework_id, after_user_id=last_user_id, limit=RECIPIENTS_CHUNK
+                )
+                if not recipients:
+                    break
+                await asyncio.gather(*(deliver(user_id) for user_id in recipients))
+                last_user_id = recipients[-1]
+
+            stats = await self.db.get_delivery_stats(homework_id)
+            logger.info(
+                f"Рассылка по заданию {homework_id} завершена: "
+                f"доставлено {stats['sent']}, ошибок {stats['failed']}"
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Ошибка рассылки по заданию {homework_id}")
+
+    async def _deliver(self, homework_id, user_id, text, keyboard):
+        try:
+            await self.sender.send_message(user_id, text, reply_markup=keyboard)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Пользователь заблокировал бота или чат недоступен — повторять бессмысленно
+            await self.db.mark_delivery(homework_id, user_id, "failed", str(e))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Не удалось доставить задание {homework_id} пользователю {user_id}: {e}")
+            await self.db.mark_delivery(homework_id, user_id, "failed", str(e))
+        else:
+            await self.db.mark_delivery(homework_id, user_id, "sent")
+
+    async def close(self):
+        """Прервать рассылки; недоставленные продолжатся после перезапуска"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process кэши
+"""
+
+import time
+from collections import OrderedDict
+
+# Маркер промаха: позволяет кэшировать None (например, «пользователь не найден»)
+MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш с ограничением времени жизни записей и счётчиками попаданий"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        """Получить значение или default, если его нет или оно устарело"""
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        """Сохранить значение, вытесняя самые старые записи"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Удалить запись"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Очистить кэш"""
+        self._data.clear()
+
+    def stats(self):
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Выгрузка всех работ по заданию одним архивом
+
+Архив собирается потоково: работы обрабатываются по одной, файл
+читается с диска (или сначала скачивается по file_id в кэш хранилища)
+и дописывается в ZIP порциями, поэтому память не зависит от размера
+задания. Архив делится на части не больше лимита Bot API на отправку
+документа; готовая часть отправляется преподавателю и удаляется, прежде
+чем собирается следующая. Запись ZIP выполняется в отдельном потоке и не
+останавливает обработку обновлений других пользователей.
+"""
+
+import asyncio
+import logging
+import re
+import shutil
+import uuid
+import zipfile
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendDocument, SendMessage
+from aiogram.types import FSInputFile
+
+from config import EXPORT_PART_SIZE
+from utils.sender import PRIORITY_INTERACTIVE
+from utils.storage import UploadError
+
+logger = logging.getLogger(__name__)
+
+# Порция копирования файла в архив
+COPY_CHUNK = 1024 * 1024
+# Уже сжатые форматы кладутся в архив без повторного сжатия
+STORED_EXTENSIONS = {"jpg", "jpeg", "png", "zip", "docx", "pdf"}
+
+
+def safe_name(text, fallback="file"):
+    """Имя файла или папки без разделителей путей и служебных символов"""
+    text = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', "_", str(text or "")).strip(" .")
+    return text[:100] or fallback
+
+
+def _header_size(arcname):
+    """Верхняя оценка заголовка записи (локального или в каталоге архива) с полями zip64"""
+    return 46 + len(arcname.encode("utf-8")) + 32
+
+
+def _missing(folder, file_name, error):
+    """Запись-записка вместо файла, который не удалось получить"""
+    text = f"Файл {file_name} не удалось получить: {error}\n".encode("utf-8")
+    return f"{folder}/missing.txt", text, len(text)
+
+
+class _ZipPart:
+    """Одна часть архива на диске (методы вызываются в отдельном потоке)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "w", allowZip64=True)
+        self.entries = 0
+        # Каталог архива дописывается при закрытии, его размер учитываем заранее
+        self._directory = 22
+
+    @property
+    def size(self):
+        """Размер части после закрытия (с каталогом), верхняя оценка"""
+        return self._zip.fp.tell() + self._directory
+
+    def add(self, arcname, source, size):
+        """Дописать запись: source — bytes или путь к файлу
+
+        Файл открывается до создания записи: если его уже нет, архив не меняется.
+        """
+        extension = arcname.rsplit(".", 1)[-1].lower() if "." in arcname else ""
+        info = zipfile.ZipInfo(arcname)
+        info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+        info.file_size = size
+        if isinstance(source, bytes):
+            with self._zip.open(info, "w") as target:
+                target.write(source)
+        else:
+            with open(source, "rb") as file, self._zip.open(info, "w") as target:
+                shutil.copyfileobj(file, target, COPY_CHUNK)
+        self.entries += 1
+        self._directory += _header_size(arcname)
+
+    def close(self):
+        self._zip.close()
+        return self.path
+
+
+class SubmissionExporter:
+    """Сборка и отправка архивов с работами учеников"""
+
+    def __init__(self, db, storage, sender, part_size=EXPORT_PART_SIZE):
+        self.db = db
+        self.storage = storage
+        self.sender = sender
+        self.part_size = part_size
+        self._tasks = {}
+
+    async def _entries(self, submission):
+        """Записи архива для одной работы: (имя в архиве, bytes или путь к файлу, размер)"""
+        name = " ".join(filter(None, [submission['last_name'], submission['first_name']]))
+        folder = safe_name(f"{name} {submission['user_id']}" if name else submission['user_id'])
+        entries = []
+        if submission['text_content']:
+            text = submission['text_content'].encode("utf-8")
+            entries.append((f"{folder}/answer.txt", text, len(text)))
+        try:
+            path = await self.storage.materialize(self.sender.bot, submission)
+            if path is not None:
+                entries.append((f"{folder}/{safe_name(submission['file_name'])}", path, path.stat().st_size))
+        except (OSError, TelegramBadRequest, UploadError) as e:
+            logger.warning(f"Файл работы {submission['id']} не попал в архив: {e}")
+            entries.append(_missing(folder, submission['file_name'], e))
+        return entries
+
+    async def export_parts(self, homework_id):
+        """Асинхронный генератор путей готовых частей архива
+
+        Следующая часть начинается, когда очередная запись не помещается
+        в part_size. Файлы частей удаляет вызывающий код.
+        """
+        homework = await self.db.get_homework_details(homework_id)
+        submissions = await self.db.get_homework_submissions(homework_id)
+        prefix = f"{safe_name(homework['title'], 'homework')}_{uuid.uuid4().hex[:8]}"
+        part = None
+        number = 0
+        try:
+            for submission in submissions:
+                for arcname, source, size in await self._entries(submission):
+                    needed = size + 2 * _header_size(arcname)
+                    if part is not None and part.entries and part.size + needed > self.part_size:
+                        yield await asyncio.to_thread(part.close)
+                        part = None
+                    if part is None:
+                        number += 1
+                        path = self.storage.tmp_dir / f"{prefix}_part{number}.zip"
+                        part = await asyncio.to_thread(_ZipPart, path)
+                    try:
+                        await asyncio.to_thread(part.add, arcname, source, size)
+                    except FileNotFoundError as e:
+                        # Файл вытеснили из кэша после materialize — вместо него записка
+                        folder, file_name = arcname.rsplit("/", 1)
+                        logger.warning(f"Файл {arcname} не попал в архив: {e}")
+                        await asyncio.to_thread(part.add, *_missing(folder, file_name, e))
+            if part is not None:
+                path, part = await asyncio.to_thread(part.close), None
+                yield path
+        finally:
+            if part is not None:
+                # Выгрузку прервали — недособранную часть удаляем
+                await asyncio.to_thread(part.close)
+                part.path.unlink(missing_ok=True)
+
+    def start(self, homework_id, chat_id):
+        """Собрать и отправить архив в фоне (повторный запрос, пока идёт выгрузка, игнорируется)"""
+        key = (homework_id, chat_id)
+        if key in self._tasks:
+            return self._tasks[key]
+        task = asyncio.create_task(self._run(homework_id, chat_id))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return task
+
+    async def _run(self, homework_id, chat_id):
+        parts = 0
+        try:
+            async for path in self.export_parts(homework_id):
+                parts += 1
+                try:
+                    await self.sender.call(
+                        SendDocument(chat_id=chat_id, document=FSInputFile(path),
+                                     caption=f"📦 Работы учеников, часть {parts}"),
+                        chat_id, PRIORITY_INTERACTIVE
+                    )
+                finally:
+                    path.unlink(missing_ok=True)
+            if parts == 0:
+                await self.sender.call(
+                    SendMessage(chat_id=chat_id, text="📭 По этому заданию работ пока нет"),
+                    chat_id, PRIORITY_INTERACTIVE
+                )
+            logger.info(f"Архив работ по заданию {homework_id} отправлен: частей {parts}")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Ошибка выгрузки работ по заданию {homework_id}")
+            try:
+                await self.sender.call(
+                    SendMessage(chat_id=chat_id, text="❌ Не удалось собрать архив работ, подробности в логе"),
+                    chat_id, PRIORITY_INTERACTIVE
+                )
+            except Exception:
+                logger.exception(f"Не удалось сообщить об ошибке выгрузки в чат {chat_id}")
+
+    async def close(self):
+        """Прервать незавершённые выгрузки"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -7,6 +7,7 @@
 from datetime import datetime, timedelta
 from config import TEACHER_CODE
 from database import Database
+from utils import recurrence
 
 db = Database()
 
@@ -23,7 +24,7 @@ def format_homework_list(homework_list, is_teacher=False):
     text = "📝 <b>Домашние задания:</b>\n\n"
 
     for hw in homework_list:
-        status_emoji = "✅" if hw['status'] == 'submitted' else "📝"
+        status_emoji = "✅" if hw.get('status') == 'submitted' else "📝"
         if is_teacher:
             status_emoji = "✅" if hw.get('submission_count', 0) > 0 else "📝"
 
@@ -32,7 +33,7 @@ def format_homework_list(homework_list, is_teacher=False):
 
         if hw.get('grade'):
             text += f"⭐ Оценка: {hw['grade']}/5\n"
-        elif hw['status'] == 'submitted':
+        elif hw.get('status') == 'submitted':
             text += "⏳ Ожидает проверки\n"
 
         text += "\n"
@@ -60,13 +61,46 @@ def format_schedule(schedule):
 
     return text
 
+def parse_page_callback(callback_data):
+    """Разобрать callback перелистывания вида <prefix>_next_<id> / <prefix>_prev_<id>
+
+    Возвращает (after_id, before_id) для методов Database.*_page
+    """
+    direction, cursor_id = callback_data.rsplit("_", 2)[1:]
+    if direction == "next":
+        return int(cursor_id), None
+    return None, int(cursor_id)
+
+def format_week_schedule(occurrences, monday):
+    """Форматировать расписание на конкретную неделю (занятия с датами)"""
+    sunday = monday + timedelta(days=6)
+    period = f"{monday.strftime('%d.%m')} – {sunday.strftime('%d.%m.%Y')}"
+    if not occurrences:
+        return f"📅 <b>Неделя {period}</b>\n\nЗанятий нет"
+
+    days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+    text = f"📅 <b>Неделя {period}</b>\n\n"
+
+    current_day = None
+    for lesson in occurrences:
+        start = lesson['start']
+        if start.date() != current_day:
+            current_day = start.date()
+            text += f"📅 <b>{days[start.weekday()]}, {start.strftime('%d.%m')}</b>\n"
+
+        text += f"⏰ {start.strftime('%H:%M')}–{lesson['end'].strftime('%H:%M')} - {lesson['subject']}"
+        if lesson.get('group_name'):
+            text += f" (группа: {lesson['group_name']})"
+        text += "\n"
+
+    return text
+
 def get_current_week_dates():
     """Получить даты текущей недели"""
-    today = datetime.now()
     days = []
 
-    # Найти понедельник текущей недели
-    monday = today - timedelta(days=today.weekday())
+    # Понедельник текущей недели в часовом поясе бота
+    monday = recurrence.week_start()
 
     for i in range(7):
         day = monday + timedelta(days=i)
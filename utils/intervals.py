@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Поиск пересечений в расписании
+
+Для преподавателя, каждой группы и каждого ученика хранится отсортированный
+список интервалов занятий недели (минуты от начала понедельника). Проверка
+нового занятия — бинарный поиск, без сканирования таблицы schedule.
+Database проверяет каждое новое занятие перед вставкой
+(create_schedule_entry) и отклоняет пересекающиеся.
+"""
+
+import bisect
+import logging
+
+from config import WORKDAY_START, WORKDAY_END, SLOT_STEP_MINUTES
+from utils.recurrence import parse_time
+
+logger = logging.getLogger(__name__)
+
+MINUTES_IN_DAY = 24 * 60
+MINUTES_IN_WEEK = 7 * MINUTES_IN_DAY
+
+
+def week_minutes(day_of_week, time_str):
+    """Начало занятия в минутах от понедельника 00:00"""
+    hour, minute = parse_time(time_str)
+    return (day_of_week - 1) * MINUTES_IN_DAY + hour * 60 + minute
+
+
+def lesson_intervals(day_of_week, time_str, duration):
+    """Интервалы [начало, конец) занятия; переходящее через ночь на понедельник делится на два"""
+    start = week_minutes(day_of_week, time_str)
+    end = start + (duration or 0)
+    if end <= MINUTES_IN_WEEK:
+        return [(start, end)]
+    return [(start, MINUTES_IN_WEEK), (0, end - MINUTES_IN_WEEK)]
+
+
+class IntervalIndex:
+    """Отсортированный по началу список интервалов недели"""
+
+    __slots__ = ("_starts", "_items", "_max_length")
+
+    def __init__(self):
+        self._starts = []
+        self._items = []
+        self._max_length = 0
+
+    def add(self, start, end, ref):
+        position = bisect.bisect_right(self._starts, start)
+        self._starts.insert(position, start)
+        self._items.insert(position, (start, end, ref))
+        self._max_length = max(self._max_length, end - start)
+
+    def overlaps(self, start, end):
+        """Интервалы, пересекающиеся с [start, end): O(log n + k)"""
+        found = []
+        # Пересекаться могут только интервалы, начавшиеся не раньше start - max_length
+        position = bisect.bisect_right(self._starts, start - self._max_length)
+        while position < len(self._items) and self._items[position][0] < end:
+            item_start, item_end, ref = self._items[position]
+            if item_end > start:
+                found.append(ref)
+            position += 1
+        return found
+
+    def items(self):
+        """Все интервалы (начало, конец, ref) по возрастанию начала"""
+        return list(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ScheduleConflict(Exception):
+    """Новое занятие пересекается с уже назначенными
+
+    conflicts — список пересечений (см. ScheduleConflicts.find_conflicts),
+    slots — ближайшие свободные начала в тот же день («ЧЧ:ММ»).
+    """
+
+    def __init__(self, conflicts, slots):
+        super().__init__(f"Пересечение с {len(conflicts)} занятиями")
+        self.conflicts = conflicts
+        self.slots = slots
+
+
+class ScheduleConflicts:
+    """Индексы занятий преподавателя, групп и учеников
+
+    teacher — все занятия; groups[group_id] — групповые занятия группы;
+    students[user_id] — индивидуальные занятия ученика. Занятия группы у
+    её учеников не копируются: при проверке к индексу ученика добавляются
+    индексы его групп (из индекса участников Database).
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.teacher = IntervalIndex()
+        self.groups = {}
+        self.students = {}
+        self._entries = {}
+
+    def _index(self, indexes, key):
+        index = indexes.get(key)
+        if index is None:
+            index = indexes[key] = IntervalIndex()
+        return index
+
+    def load(self, entries):
+        """Построить индексы по всему расписанию (при запуске бота)"""
+        for entry in entries:
+            self.add(entry)
+        logger.info(f"Индекс пересечений расписания построен: {len(self._entries)} занятий")
+
+    def add(self, entry):
+        """Добавить запись расписания в индексы"""
+        try:
+            intervals = lesson_intervals(entry['day_of_week'], entry['time'], entry['duration'])
+        except (ValueError, AttributeError):
+            return
+        self._entries[entry['id']] = entry
+        indexes = [self.teacher]
+        if entry['group_id']:
+            indexes.append(self._index(self.groups, entry['group_id']))
+        if entry['user_id']:
+            indexes.append(self._index(self.students, entry['user_id']))
+        for index in indexes:
+            for start, end in intervals:
+                index.add(start, end, entry['id'])
+
+    def _affected(self, user_id, group_id):
+        """Индексы участников занятия: O(число групп ученика), без обхода состава группы"""
+        indexes = [("teacher", None, self.teacher)]
+        if group_id:
+            indexes.append(("group", group_id, self.groups.get(group_id)))
+        if user_id:
+            indexes.append(("student", user_id, self.students.get(user_id)))
+            for member_group_id in self.db.members.groups_of(user_id):
+                indexes.append(("student", user_id, self.groups.get(member_group_id)))
+        return [item for item in indexes if item[2] is not None]
+
+    def _members_affected(self, group_id, entry):
+        """Ученики группы group_id, у которых есть пересекающееся занятие entry"""
+        if entry['group_id'] == group_id:
+            return []
+        members = self.db.members
+        if entry['user_id']:
+            return [entry['user_id']] if members.is_member(group_id, entry['user_id']) else []
+        if entry['group_id']:
+            other = set(members.users_of(entry['group_id']))
+            return [user_id for user_id in members.users_of(group_id) if user_id in other]
+        return []
+
+    def find_conflicts(self, user_id, group_id, day_of_week, time, duration=60):
+        """Занятия, пересекающиеся с предлагаемым
+
+        Возвращает список словарей: who ('teacher' / 'group' / 'student'),
+        who_id и entry (запись расписания).
+        """
+        conflicts = []
+        seen = set()
+
+        def found(who, who_id, entry_id):
+            if (who, who_id, entry_id) not in seen:
+                seen.add((who, who_id, entry_id))
+                conflicts.append({"who": who, "who_id": who_id, "entry": self._entries[entry_id]})
+
+        intervals = lesson_intervals(day_of_week, time, duration)
+        for who, who_id, index in self._affected(user_id, group_id):
+            for start, end in intervals:
+                for entry_id in index.overlaps(start, end):
+                    found(who, who_id, entry_id)
+        if group_id:
+            # Занятия учеников группы в других группах и индивидуальные: все они есть
+            # в индексе преподавателя, состав сверяется только для пересекающихся
+            teacher_conflicts = [conflict["entry"] for conflict in conflicts if conflict["who"] == "teacher"]
+            for entry in teacher_conflicts:
+                for member_id in self._members_affected(group_id, entry):
+                    found("student", member_id, entry['id'])
+        return conflicts
+
+    def suggest_slots(self, user_id, group_id, day_of_week, time, duration=60, count=3):
+        """Ближайшие к желаемому времени свободные начала занятия в тот же день"""
+        affected = self._affected(user_id, group_id)
+        day_start = (day_of_week - 1) * MINUTES_IN_DAY
+        first = day_start + week_minutes(1, WORKDAY_START)
+        last = day_start + week_minutes(1, WORKDAY_END) - duration
+        wanted = week_minutes(day_of_week, time)
+
+        def is_free(start):
+            return not any(index.overlaps(start, start + duration) for _, _, index in affected)
+
+        slots = []
+        # Кандидаты по очереди позже и раньше желаемого времени
+        for step in range(1, MINUTES_IN_DAY // SLOT_STEP_MINUTES):
+            for candidate in (wanted + step * SLOT_STEP_MINUTES, wanted - step * SLOT_STEP_MINUTES):
+                if first <= candidate <= last and is_free(candidate):
+                    slots.append(candidate)
+            if len(slots) >= count:
+                break
+        return [
+            f"{(slot - day_start) // 60:02d}:{(slot - day_start) % 60:02d}"
+            for slot in sorted(slots[:count], key=lambda slot: abs(slot - wanted))
+        ]
+
+    def check(self, user_id, group_id, day_of_week, time, duration=60):
+        """Проверить новое занятие; при пересечениях — ScheduleConflict со свободными слотами"""
+        conflicts = self.find_conflicts(user_id, group_id, day_of_week, time, duration)
+        if conflicts:
+            raise ScheduleConflict(conflicts, self.suggest_slots(user_id, group_id, day_of_week, time, duration))
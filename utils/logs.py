@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Настройка логирования бота
+
+Обработчики кладут записи в очередь (QueueHandler) и сразу возвращаются;
+запись в файл и в консоль выполняет отдельный поток QueueListener, так что
+медленный диск не задерживает обработку обновлений. Файл лога
+переключается при превышении LOG_MAX_BYTES и в полночь, старые части
+сжимаются gzip, хранится LOG_BACKUP_COUNT последних.
+
+LOG_JSON = True включает вывод в файл по строке JSON на запись с полями
+update_id и user_id обновления, во время обработки которого она сделана.
+LOG_SAMPLING задаёт долю записываемых сообщений уровня ниже WARNING для
+шумных логгеров (например, «Update id=... is handled» от aiogram).
+"""
+
+import atexit
+import contextvars
+import copy
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+from logging.handlers import BaseRotatingHandler, QueueHandler, QueueListener
+from pathlib import Path
+
+from aiogram import BaseMiddleware
+
+from config import LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_JSON, LOG_SAMPLING
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Контекст обновления, в рамках которого сделана запись
+update_id_var = contextvars.ContextVar("update_id", default=None)
+user_id_var = contextvars.ContextVar("user_id", default=None)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет в запись update_id и user_id текущего обновления
+
+    Работает в потоке, который пишет в лог, — до передачи записи в очередь,
+    пока контекст обновления ещё доступен.
+    """
+
+    def filter(self, record):
+        record.update_id = update_id_var.get()
+        record.user_id = user_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей ниже WARNING от логгеров из rates
+
+    rates: {"имя логгера": доля}; правило действует и на дочерние логгеры.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+        # Доля для каждого встреченного имени логгера вычисляется один раз
+        self._resolved = {}
+
+    def _rate(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("update_id", "user_id"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RotatingLogFile(BaseRotatingHandler):
+    """Файл лога с переключением по размеру и в полночь; старые части сжимаются
+
+    Части называются bot.log.ГГГГММДД-ЧЧММСС-мкс.gz, лишние сверх backup_count удаляются.
+    """
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, compress=True):
+        super().__init__(filename, "a", encoding="utf-8")
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        # Первая полночь после последней записи в существующий файл
+        started = os.path.getmtime(self.baseFilename) if os.path.exists(self.baseFilename) else time.time()
+        self.rollover_at = self._next_midnight(started)
+
+    @staticmethod
+    def _next_midnight(timestamp):
+        day = datetime.fromtimestamp(timestamp).date() + timedelta(days=1)
+        return datetime(day.year, day.month, day.day).timestamp()
+
+    def shouldRollover(self, record):
+        if record.created >= self.rollover_at:
+            return True
+        if self.stream is None:
+            self.stream = self._open()
+        return self.max_bytes > 0 and self.stream.tell() >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        base = Path(self.baseFilename)
+        if base.exists() and base.stat().st_size > 0:
+            # Время с микросекундами: имена уникальны и сортируются по возрасту
+            target = base.with_name(f"{base.name}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}")
+            os.replace(base, target)
+            if self.compress:
+                with open(target, "rb") as source, gzip.open(f"{target}.gz", "wb") as compressed:
+                    shutil.copyfileobj(source, compressed)
+                target.unlink()
+            self._remove_old(base)
+        self.rollover_at = self._next_midnight(time.time())
+        self.stream = self._open()
+
+    def _remove_old(self, base):
+        if self.backup_count <= 0:
+            return
+        parts = sorted(base.parent.glob(f"{base.name}.*"))
+        for path in parts[:-self.backup_count]:
+            path.unlink(missing_ok=True)
+
+
+class _QueueHandler(QueueHandler):
+    """QueueHandler, который сохраняет трассировку отдельно от текста сообщения"""
+
+    def prepare(self, record):
+        # Текст и трассировка вычисляются здесь: аргументы записи могут измениться,
+        # пока она ждёт в очереди, а объект исключения не нужен в другом потоке
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Внешний middleware: update_id и user_id обновления для записей лога"""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        update_token = update_id_var.set(getattr(event, "update_id", None))
+        user_token = user_id_var.set(user.id if user else None)
+        try:
+            return await handler(event, data)
+        finally:
+            update_id_var.reset(update_token)
+            user_id_var.reset(user_token)
+
+
+def setup_logging(level=LOG_LEVEL, log_file=LOG_FILE, json_format=LOG_JSON, sampling=LOG_SAMPLING):
+    """Направить логи через очередь в файл с ротацией и в консоль
+
+    Возвращает запущенный QueueListener; он останавливается (с записью
+    оставшихся сообщений) при выходе из процесса.
+    """
+    file_handler = RotatingLogFile(log_file)
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    queue_handler.addFilter(SamplingFilter(sampling))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
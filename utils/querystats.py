@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Статистика SQL-запросов Database
+
+Каждый запрос замеряется и относится к методу Database, из которого он
+выполнен. Запросы дольше DB_SLOW_QUERY_MS попадают в лог (логгер
+database.queries) вместе с параметрами и планом EXPLAIN QUERY PLAN.
+
+В режиме проверки планов (DB_CHECK_QUERY_PLANS, для тестов и
+`db_tools.py check-plans`) план каждого нового запроса из «горячих»
+методов проверяется один раз; полный просмотр таблицы без индекса
+вызывает QueryPlanError. Так регрессия находится до того, как данных
+станет много. check-plans проверяет копию базы без sqlite_stat1: по
+собранной статистике планировщик может выбрать просмотр небольшой
+таблицы и при наличии подходящего индекса.
+"""
+
+import functools
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from config import DB_SLOW_QUERY_MS, DB_CHECK_QUERY_PLANS
+
+logger = logging.getLogger("database.queries")
+
+# Строка плана с полным просмотром: «SCAN homework» или «SCAN h», но не
+# «SCAN h USING INDEX ...» и не просмотр подзапроса или константы
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!\()(\S+)(?: AS \S+)?$")
+
+
+class QueryPlanError(AssertionError):
+    """Запрос горячего метода просматривает таблицу целиком"""
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize(sql):
+    """Текст запроса без лишних пробелов; списки IN (?, ?, ...) любой длины совпадают"""
+    sql = " ".join(sql.split())
+    return re.sub(r"\?(?:\s*,\s*\?)+", "?, ...", sql)
+
+
+def caller_method():
+    """Имя ближайшего публичного метода в стеке вызова (метод Database)"""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_name.startswith("_"):
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "?"
+
+
+def format_plan(rows):
+    """Дерево плана из строк EXPLAIN QUERY PLAN (id, parent, notused, detail)"""
+    depth = {0: 0}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return "\n".join(lines)
+
+
+class QueryStats:
+    """Суммарное время запросов по (метод, текст запроса)
+
+    Вызывается и из цикла событий, и из потока писателя — счётчики под блокировкой.
+    """
+
+    def __init__(self, slow_ms=DB_SLOW_QUERY_MS, check_plans=DB_CHECK_QUERY_PLANS, hot_methods=()):
+        self.slow = slow_ms / 1000
+        self.check_plans = check_plans
+        self.hot_methods = frozenset(hot_methods)
+        self._lock = threading.Lock()
+        # (метод, запрос) -> [число, суммарное время, максимум]
+        self._stats = {}
+        # Запросы, план которых уже проверен
+        self._checked = set()
+
+    def record(self, method, sql, elapsed):
+        """Учесть выполненный запрос; True, если для него нужно получить план"""
+        key = (method, normalize(sql))
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+        if elapsed >= self.slow:
+            return True
+        return self.check_plans and method in self.hot_methods and key not in self._checked
+
+    def plan_collected(self, method, sql, params, elapsed, rows):
+        """Записать медленный запрос в лог и проверить план горячего запроса"""
+        plan = format_plan(rows)
+        if elapsed >= self.slow:
+            shown = repr(params)
+            if len(shown) > 500:
+                shown = shown[:500] + "…"
+            logger.warning(
+                f"Медленный запрос в {method}: {elapsed * 1000:.1f} мс\n"
+                f"{normalize(sql)}\nПараметры: {shown}\nПлан:\n{plan}"
+            )
+        if self.check_plans and method in self.hot_methods:
+            self._checked.add((method, normalize(sql)))
+            scans = [detail for _, _, _, detail in rows if FULL_SCAN.match(detail)]
+            if scans:
+                raise QueryPlanError(
+                    f"{method}: полный просмотр ({', '.join(scans)})\n{normalize(sql)}\nПлан:\n{plan}"
+                )
+
+    def top(self, limit=10, by="total"):
+        """Самые затратные запросы: [(метод, запрос, число, всего сек, максимум сек)]"""
+        column = {"count": 0, "total": 1, "max": 2}[by]
+        with self._lock:
+            items = [(method, sql, *entry) for (method, sql), entry in self._stats.items()]
+        items.sort(key=lambda item: item[2 + column], reverse=True)
+        return items[:limit]
+
+    def by_method(self):
+        """Суммарно по методам: {метод: (число запросов, всего сек)}"""
+        result = {}
+        with self._lock:
+            for (method, _), (count, total, _) in self._stats.items():
+                previous_count, previous_total = result.get(method, (0, 0.0))
+                result[method] = (previous_count + count, previous_total + total)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class _TimedCursor:
+    """Курсор aiosqlite, который замеряет запрос до получения результата"""
+
+    __slots__ = ("_cursor", "_connection", "_stats", "_method", "_sql", "_params", "_started", "_recorded")
+
+    def __init__(self, cursor, connection, stats, method, sql, params, started):
+        self._cursor = cursor
+        self._connection = connection
+        self._stats = stats
+        self._method = method
+        self._sql = sql
+        self._params = params
+        self._started = started
+        self._recorded = False
+
+    @property
+    def row_factory(self):
+        return self._cursor.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._cursor.row_factory = factory
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _finish(self):
+        if self._recorded:
+            return
+        self._recorded = True
+        elapsed = time.perf_counter() - self._started
+        if self._stats.record(self._method, self._sql, elapsed):
+            try:
+                cursor = await self._connection.execute(f"EXPLAIN QUERY PLAN {self._sql}", self._params)
+                rows = await cursor.fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось получить план запроса из {self._method}: {e}")
+                return
+            self._stats.plan_collected(self._method, self._sql, self._params, elapsed, rows)
+
+    async def fetchall(self):
+        rows = await self._cursor.fetchall()
+        await self._finish()
+        return rows
+
+    async def fetchone(self):
+        row = await self._cursor.fetchone()
+        await self._finish()
+        return row
+
+
+class TimedConnection:
+    """Соединение aiosqlite из пула: execute замеряется и относится к методу"""
+
+    __slots__ = ("_connection", "_stats")
+
+    def __init__(self, connection, stats):
+        self._connection = connection
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    async def execute(self, sql, params=()):
+        method = caller_method()
+        started = time.perf_counter()
+        cursor = await self._connection.execute(sql, params)
+        return _TimedCursor(cursor, self._connection, self._stats, method, sql, params, started)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Планировщик напоминаний о занятиях и сроках домашних заданий
+
+Ближайшие события хранятся в min-куче по времени срабатывания: планировщик
+спит до ближайшего события (а не опрашивает базу), новые записи расписания
+и задания попадают в кучу через события Database без пересканирования.
+Отправленные напоминания отмечаются в sent_reminders, поэтому после
+перезапуска они не дублируются.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+
+from records import Homework, ScheduleEntry
+from utils import recurrence
+from config import LESSON_REMINDER_MINUTES, HOMEWORK_REMINDER_TIME, REMINDER_GRACE
+
+logger = logging.getLogger(__name__)
+
+# События, наступающие в пределах этого окна (сек), отправляются одной пачкой
+BATCH_WINDOW = 1.0
+
+LESSON = "lesson"
+HOMEWORK = "homework"
+
+
+class ReminderScheduler:
+    """Напоминания «занятие через 30 минут» и «срок сдачи завтра»"""
+
+    def __init__(self, db, sender, lesson_minutes=LESSON_REMINDER_MINUTES,
+                 homework_time=HOMEWORK_REMINDER_TIME, grace=REMINDER_GRACE):
+        self.db = db
+        self.sender = sender
+        self.lesson_before = timedelta(minutes=lesson_minutes)
+        self.homework_time = recurrence.parse_time(homework_time)
+        self.grace = grace
+        # Элементы кучи: (время срабатывания, порядковый номер, вид, id, дата события)
+        self._heap = []
+        self._seq = itertools.count()
+        self._lessons = {}
+        self._homework = {}
+        self._changed = asyncio.Event()
+        self._task = None
+        self._dispatches = set()
+
+    def _lesson_event(self, entry, after):
+        """Ближайшее напоминание о занятии, срабатывающее позже after"""
+        start = recurrence.next_weekly_occurrence(
+            entry['day_of_week'], entry['time'], after + self.lesson_before
+        )
+        fire_at = start - self.lesson_before
+        return (fire_at.timestamp(), next(self._seq), LESSON, entry['id'], start.isoformat())
+
+    def _homework_event(self, homework, after):
+        """Напоминание накануне срока сдачи (None, если срок не распознан или прошёл)"""
+        due = recurrence.parse_due_date(homework['due_date'])
+        if due is None:
+            return None
+        fire_at = recurrence.localize(due - timedelta(days=1), *self.homework_time)
+        if fire_at <= after:
+            return None
+        return (fire_at.timestamp(), next(self._seq), HOMEWORK, homework['id'], due.isoformat())
+
+    def _push(self, event):
+        if event is None:
+            return
+        heapq.heappush(self._heap, event)
+        if self._heap[0] is event:
+            # Новое событие раньше текущего ближайшего — будим цикл
+            self._changed.set()
+
+    async def start(self):
+        """Загрузить расписание и задания в кучу и запустить планировщик"""
+        after = recurrence.now() - timedelta(seconds=self.grace)
+        events = []
+        for entry in await self.db.get_all_schedule_entries():
+            try:
+                events.append(self._lesson_event(entry, after))
+            except (ValueError, AttributeError):
+                logger.warning(f"Некорректное время в записи расписания {entry['id']}: {entry['time']}")
+                continue
+            self._lessons[entry['id']] = entry
+        for homework in await self.db.get_homework_with_due_dates():
+            event = self._homework_event(homework, after)
+            if event is not None:
+                self._homework[homework['id']] = homework
+                events.append(event)
+        heapq.heapify(events)
+        self._heap = events
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Планировщик напоминаний запущен: {len(events)} событий")
+
+    def on_schedule_created(self, entry_id, user_id, group_id, day_of_week, time, duration,
+                            subject, group_name):
+        """Обработчик события Database: новая запись расписания"""
+        entry = ScheduleEntry(
+            id=entry_id, user_id=user_id, group_id=group_id,
+            day_of_week=day_of_week, time=time, duration=duration,
+            subject=subject, group_name=group_name
+        )
+        self._lessons[entry_id] = entry
+        self._push(self._lesson_event(entry, recurrence.now()))
+
+    def on_homework_created(self, homework_id, title, group_id, user_id, due_date):
+        """Обработчик события Database: новое задание"""
+        homework = Homework(
+            id=homework_id, title=title, group_id=group_id,
+            user_id=user_id, due_date=due_date
+        )
+        event = self._homework_event(homework, recurrence.now())
+        if event is not None:
+            self._homework[homework_id] = homework
+            self._push(event)
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = []
+            horizon = time.time() + BATCH_WINDOW
+            while self._heap and self._heap[0][0] <= horizon:
+                batch.append(heapq.heappop(self._heap))
+            # Следующее занятие серии планируется сразу, отправка идёт в фоне
+            for fire_at, _, kind, ref_id, _ in batch:
+                if kind == LESSON and ref_id in self._lessons:
+                    after = datetime.fromtimestamp(fire_at, recurrence.TZ)
+                    self._push(self._lesson_event(self._lessons[ref_id], after))
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        """Разослать пачку наступивших напоминаний"""
+        sends = []
+        now = time.time()
+        # Бот был выключен во время события — напоминание уже неактуально
+        due = list(dict.fromkeys(
+            (kind, ref_id, occurrence) for fire_at, _, kind, ref_id, occurrence in batch
+            if fire_at >= now - self.grace
+        ))
+        try:
+            claimed = await self.db.claim_reminders(due)
+        except Exception:
+            logger.exception(f"Ошибка отметки пачки из {len(due)} напоминаний")
+            return
+        for kind, ref_id, occurrence in due:
+            if (kind, ref_id, occurrence) not in claimed:
+                continue
+            try:
+                if kind == LESSON:
+                    entry = self._lessons.get(ref_id)
+                    if entry is None:
+                        continue
+                    text = self._format_lesson(entry, occurrence)
+                    recipients = await self.db.get_lesson_recipients(entry['user_id'], entry['group_id'])
+                else:
+                    homework = self._homework.pop(ref_id, None)
+                    if homework is None:
+                        continue
+                    text = self._format_homework(homework)
+                    recipients = await self.db.get_homework_pending_recipients(ref_id)
+            except Exception:
+                logger.exception(f"Ошибка подготовки напоминания {kind} {ref_id}")
+                continue
+            sends.extend(self._send(user_id, text) for user_id in recipients)
+
+        if sends:
+            results = await asyncio.gather(*sends, return_exceptions=True)
+            failed = sum(1 for result in results if isinstance(result, Exception))
+            logger.info(f"Отправлено напоминаний: {len(results) - failed}, ошибок: {failed}")
+
+    async def _send(self, user_id, text):
+        return await self.sender.send_message(user_id, text)
+
+    def _format_lesson(self, entry, occurrence):
+        start = datetime.fromisoformat(occurrence)
+        minutes = int(self.lesson_before.total_seconds() // 60)
+        text = f"⏰ <b>Через {minutes} минут занятие!</b>\n\n"
+        text += f"📚 {entry['subject']}"
+        if entry.get('group_name'):
+            text += f" (группа: {entry['group_name']})"
+        text += f"\n🕐 Начало в {start.strftime('%H:%M')}, {entry['duration']} мин"
+        return text
+
+    def _format_homework(self, homework):
+        return (
+            "📝 <b>Завтра срок сдачи задания!</b>\n\n"
+            f"<b>{homework['title']}</b>\n"
+            f"📅 Срок: {homework['due_date']}\n\n"
+            "Не забудьте сдать работу 😊"
+        )
+
+    def stats(self):
+        """Размер очереди и время ближайшего события"""
+        return {
+            "scheduled": len(self._heap),
+            "next_in": max(0.0, self._heap[0][0] - time.time()) if self._heap else None,
+        }
+
+    async def close(self):
+        """Остановить планировщик и дождаться начатых рассылок"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Недельное расписание ученика с мемоизацией
+
+Экраны «На эту неделю» / «На следующую неделю» вычисляются один раз на
+пару (пользователь, неделя) и сбрасываются при изменении расписания
+или состава групп.
+"""
+
+from config import WEEK_CACHE_SIZE, WEEK_CACHE_TTL
+from utils import recurrence
+from utils.cache import TTLCache, MISSING
+from utils.helpers import format_week_schedule
+
+
+class WeekScheduleCache:
+    """Мемоизированные занятия и текст расписания по (user_id, понедельник недели)"""
+
+    def __init__(self, db, maxsize=WEEK_CACHE_SIZE, ttl=WEEK_CACHE_TTL):
+        self.db = db
+        # user_id -> {понедельник: (занятия, текст)}
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._epoch = 0
+
+    async def get_week(self, user_id, weeks_ahead=0):
+        """Занятия и отформатированный текст на неделю"""
+        monday = recurrence.week_start(weeks_ahead)
+        weeks = self.cache.get(user_id)
+        if weeks is not MISSING and monday in weeks:
+            return weeks[monday]
+
+        epoch = self._epoch
+        entries = await self.db.get_user_schedule(user_id)
+        occurrences = recurrence.expand_week(entries, monday)
+        result = (occurrences, format_week_schedule(occurrences, monday))
+        # Если расписание поменялось во время запроса, результат не сохраняем
+        if epoch == self._epoch:
+            weeks = self.cache.get(user_id)
+            if weeks is MISSING:
+                weeks = {}
+                self.cache.set(user_id, weeks)
+            weeks[monday] = result
+        return result
+
+    def invalidate_user(self, user_id):
+        self._epoch += 1
+        self.cache.invalidate(user_id)
+
+    def on_schedule_created(self, entry_id, user_id, group_id, **_):
+        """Обработчик события Database: новая запись расписания"""
+        if group_id:
+            # Групповое занятие затрагивает всех участников группы
+            for member_id in self.db.members.users_of(group_id):
+                self.invalidate_user(member_id)
+        if user_id:
+            self.invalidate_user(user_id)
+
+    def on_group_member_added(self, group_id, user_id):
+        """Обработчик события Database: ученик добавлен в группу"""
+        self.invalidate_user(user_id)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Код бота или библиотеки: классификация файлов из стеков вызовов
+
+setup_server.sh создаёт venv внутри директории проекта, поэтому одного
+«путь внутри проекта» мало: aiogram, aiosqlite и стандартная библиотека
+из venv тоже лежат там. Файлы в site-packages и в каталогах установки
+Python считаются библиотечными.
+"""
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+LIBRARY_MARKERS = frozenset({"site-packages", "dist-packages"})
+# Каталоги установки Python (venv и базовый интерпретатор), кроме содержащих сам проект
+LIBRARY_ROOTS = tuple(
+    root for root in {Path(prefix).resolve() for prefix in (sys.prefix, sys.base_prefix, sys.exec_prefix)}
+    if not PROJECT_ROOT.is_relative_to(root)
+)
+
+
+def is_library_file(filename):
+    """Файл сторонней или стандартной библиотеки"""
+    path = Path(filename)
+    if not LIBRARY_MARKERS.isdisjoint(path.parts):
+        return True
+    return any(path.is_relative_to(root) for root in LIBRARY_ROOTS)
+
+
+def is_project_file(filename):
+    """Файл кода бота (внутри проекта и не из venv)"""
+    path = Path(filename)
+    return path.is_relative_to(PROJECT_ROOT) and not is_library_file(path)
+
+
+def _after(parts, marker):
+    """Часть пути после последнего компонента marker"""
+    index = len(parts) - 1 - parts[::-1].index(marker)
+    return "/".join(parts[index + 1:])
+
+
+def short_path(filename):
+    """Путь относительно site-packages, проекта или стандартной библиотеки"""
+    path = Path(filename)
+    parts = path.parts
+    for marker in LIBRARY_MARKERS:
+        if marker in parts:
+            return _after(parts, marker) or path.name
+    if is_project_file(path):
+        return str(path.relative_to(PROJECT_ROOT))
+    if "lib" in parts:
+        return _after(parts, "lib") or path.name
+    return path.name
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище файлов сданных работ
+
+Файл работы остаётся на серверах Telegram: в submissions сохраняются его
+file_id / file_unique_id, и преподавателю он пересылается по file_id, не
+проходя через наш сервер. На диск файл скачивается только по требованию
+(выгрузка, превью) — порциями, с подсчётом SHA-256 по ходу скачивания —
+в LRU-кэш ограниченного размера: uploads/cache/ab/cd/<sha256>. Одинаковые
+файлы хранятся один раз, а двухуровневое шардирование не даёт одной
+директории разрастись до сотен тысяч файлов.
+Суммарный объём работ ученика ограничен квотой.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from config import UPLOAD_DIR, MAX_UPLOAD_SIZE, STUDENT_QUOTA, UPLOAD_CHUNK_SIZE, BLOB_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Минимальный возраст файла (сек), после которого сборщик мусора может его удалить
+GC_GRACE = 3600
+
+
+class UploadError(Exception):
+    """Файл не может быть сохранён (текст ошибки показывается ученику)"""
+
+
+class QuotaExceeded(UploadError):
+    """Файл больше допустимого размера или не помещается в квоту ученика"""
+
+
+class _HashingWriter:
+    """Файловый объект для Bot.download_file: пишет на диск, считает хэш и размер"""
+
+    def __init__(self, file, limit):
+        self._file = file
+        self._limit = limit
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self._limit:
+            # Исключение прерывает скачивание, остаток файла не загружается
+            raise QuotaExceeded("Файл превышает доступный объём")
+        self.hash.update(chunk)
+        return self._file.write(chunk)
+
+    def flush(self):
+        # Bot.download_file вызывает flush после каждой порции;
+        # сброс на диск делается один раз в конце
+        pass
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+
+def shard(file_hash):
+    """Шардированный путь файла: ab/cd/<sha256>"""
+    return f"{file_hash[:2]}/{file_hash[2:4]}/{file_hash}"
+
+
+class BlobStorage:
+    """Квоты учеников и LRU-кэш файлов, скачанных по file_id"""
+
+    def __init__(self, db, root=UPLOAD_DIR, max_size=MAX_UPLOAD_SIZE, quota=STUDENT_QUOTA,
+                 chunk_size=UPLOAD_CHUNK_SIZE, cache_size=BLOB_CACHE_SIZE):
+        self.db = db
+        self.root = Path(root)
+        self.max_size = max_size
+        self.quota = quota
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self.cache_dir = self.root / "cache"
+        self.tmp_dir = self.root / "tmp"
+        for directory in (self.cache_dir, self.tmp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        # sha256 -> размер, от давно использованных к недавним
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._scan_cache()
+
+    def cache_path(self, file_hash):
+        """Абсолютный путь файла в кэше"""
+        return self.cache_dir / shard(file_hash)
+
+    def _scan_cache(self):
+        """Восстановить порядок LRU по mtime файлов кэша (при запуске)"""
+        entries = []
+        for path in self.cache_dir.glob("*/*/*"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, file_hash, size in sorted(entries):
+            self._cache[file_hash] = size
+            self._cache_bytes += size
+
+    async def available(self, user_id, homework_id=None):
+        """Сколько байт ученик ещё может сдать (работа по homework_id будет заменена)"""
+        used = await self.db.get_student_storage_used(user_id, exclude_homework_id=homework_id)
+        return max(0, self.quota - used)
+
+    async def check_quota(self, user_id, homework_id, file_size):
+        """Проверить размер сдаваемого файла по данным Telegram; бросает QuotaExceeded"""
+        file_size = file_size or 0
+        if file_size > self.max_size or file_size > await self.available(user_id, homework_id):
+            raise QuotaExceeded("Файл превышает доступный объём")
+
+    async def materialize(self, bot, submission):
+        """Локальный путь файла работы (None, если работа без файла)
+
+        Файл, сданный по file_id, скачивается в кэш, если его там нет.
+        """
+        if not submission['file_id']:
+            return None
+
+        file_hash = submission['file_hash']
+        if file_hash and file_hash in self._cache:
+            self._touch(file_hash)
+            # Файл могли удалить с диска вручную — тогда скачиваем заново
+            if file_hash in self._cache:
+                return self.cache_path(file_hash)
+
+        file_hash, _ = await self._download(bot, submission['file_id'])
+        await self.db.set_submission_file_hash(submission['file_unique_id'], file_hash)
+        self._evict()
+        return self.cache_path(file_hash)
+
+    async def _download(self, bot, file_id):
+        """Скачать файл Telegram порциями в кэш; возвращает (sha256, размер)"""
+        tmp_path = self.tmp_dir / f"{uuid.uuid4().hex}.part"
+        try:
+            with open(tmp_path, "wb") as tmp:
+                writer = _HashingWriter(tmp, self.max_size)
+                await bot.download(file_id, destination=writer, chunk_size=self.chunk_size, seek=False)
+                tmp.flush()
+                await asyncio.to_thread(os.fsync, tmp.fileno())
+            file_hash = writer.hash.hexdigest()
+            await asyncio.to_thread(self._commit, tmp_path, self.cache_path(file_hash))
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        if file_hash in self._cache:
+            self._touch(file_hash)
+        else:
+            self._cache[file_hash] = writer.size
+            self._cache_bytes += writer.size
+        logger.info(f"Файл {file_hash[:12]}… скачан в кэш ({writer.size} байт)")
+        return file_hash, writer.size
+
+    @staticmethod
+    def _commit(tmp_path, target):
+        """Переместить скачанный файл в кэш (или удалить, если такой уже есть)"""
+        if target.exists():
+            # Одинаковое содержимое храним одной копией
+            tmp_path.unlink()
+            os.utime(target)
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target)
+
+    def _touch(self, file_hash):
+        self._cache.move_to_end(file_hash)
+        try:
+            # mtime хранит порядок LRU между перезапусками
+            os.utime(self.cache_path(file_hash))
+        except FileNotFoundError:
+            self._forget(file_hash)
+
+    def _forget(self, file_hash):
+        self._cache_bytes -= self._cache.pop(file_hash, 0)
+
+    def _evict(self):
+        """Удалить давно не использованные файлы кэша сверх cache_size
+
+        Последний скачанный файл не удаляется, даже если он один больше лимита.
+        """
+        while self._cache_bytes > self.cache_size and len(self._cache) > 1:
+            file_hash, size = self._cache.popitem(last=False)
+            self._cache_bytes -= size
+            self.cache_path(file_hash).unlink(missing_ok=True)
+
+    def cache_stats(self):
+        """Размер кэша: файлов и байт"""
+        return {"files": len(self._cache), "bytes": self._cache_bytes, "limit": self.cache_size}
+
+    def remove_stale_parts(self, grace=GC_GRACE):
+        """Удалить .part, брошенные прерванными скачиваниями
+
+        Файлы моложе grace секунд не трогаются: их может сейчас скачивать бот.
+        Возвращает (файлов, байт).
+        """
+        removed = freed = 0
+        cutoff = time.time() - grace
+        for path in self.tmp_dir.glob("*.part"):
+            stat = path.stat()
+            if stat.st_mtime > cutoff:
+                continue
+            path.unlink()
+            removed += 1
+            freed += stat.st_size
+        return removed, freed
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Режим работы через webhook (альтернатива long polling)
+
+aiohttp-сервер принимает обновления от Telegram на WEBHOOK_PATH, проверяет
+заголовок X-Telegram-Bot-Api-Secret-Token, сразу отвечает 200 и обрабатывает
+обновление в фоне на Dispatcher.
+
+Бот должен работать в одном процессе: кэш пользователей, индекс
+участников групп, индекс пересечений расписания с его блокировкой, куча
+напоминаний и лимиты отправки живут в памяти процесса и между
+экземплярами не синхронизируются. Второй экземпляр за тем же прокси
+отвечал бы по устаревшим данным и пропускал пересечения занятий.
+
+Локальная проверка (WEBHOOK_URL пустой — setWebhook не вызывается):
+    curl -X POST http://127.0.0.1:8080/webhook \\
+         -H "Content-Type: application/json" \\
+         -H "X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET>" \\
+         -d @update.json
+"""
+
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT
+
+logger = logging.getLogger(__name__)
+
+
+def create_app(dp, bot):
+    """Собрать aiohttp-приложение с обработчиком обновлений"""
+    app = web.Application()
+    handler = SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET or None,
+    )
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def set_webhook(dp, bot):
+    """Сообщить Telegram адрес webhook (если задан публичный URL)"""
+    if not WEBHOOK_URL:
+        logger.info("WEBHOOK_URL не задан — setWebhook пропущен (локальный режим)")
+        return
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не задан — запросы к webhook не проверяются")
+    await bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Webhook установлен: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+
+
+async def run_webhook(dp, bot):
+    """Запустить webhook-сервер и работать до SIGINT/SIGTERM"""
+    app = create_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    try:
+        await site.start()
+        await set_webhook(dp, bot)
+        logger.info(f"Webhook-сервер слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+        await stop.wait()
+    finally:
+        await runner.cleanup()